@@ -1,14 +1,71 @@
 #!/usr/local/bin/python3
 
 from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import itertools
+import random
+import threading
+import queue
+import time
 import boto3
+import decoder
+
+# Connections - sessions and clients are cached per (online, region, endpoint_url) and shared by every call. boto3
+# resources are not thread safe, so each thread gets its own resource, built on the cached session.
+local_endpoint_url = 'http://localhost:8000'
+connection_config = Config(
+    max_pool_connections=50,
+    connect_timeout=5,
+    read_timeout=10,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+)
+connections = {}
+connections_lock = threading.Lock()
+connections_local = threading.local()
+
+def get_connection_key_AWS(online, region, endpoint_url=None):
+    if not online and not endpoint_url:
+        endpoint_url = local_endpoint_url
+    return (bool(online), region, endpoint_url)
+
+def get_session_AWS(online, region, endpoint_url=None):
+    key = get_connection_key_AWS(online, region, endpoint_url)
+    with connections_lock:
+        if key not in connections:
+            connections[key] = {'session': boto3.session.Session(region_name=region), 'clients': {}}
+        return connections[key]['session']
+
+# Get the shared low-level DynamoDB client (clients are thread safe)
+def get_dynamodb_client_AWS(online, region, endpoint_url=None, service_name='dynamodb'):
+    key = get_connection_key_AWS(online, region, endpoint_url)
+    session = get_session_AWS(online, region, endpoint_url)
+    with connections_lock:
+        clients = connections[key]['clients']
+        if service_name not in clients:
+            clients[service_name] = session.client(service_name, endpoint_url=key[2], config=connection_config)
+        return clients[service_name]
+
+# Get this thread's DynamoDB resource
+def get_dynamodb_AWS(online, region, endpoint_url=None):
+    key = get_connection_key_AWS(online, region, endpoint_url)
+    resources = connections_local.__dict__.setdefault('resources', {})
+    session = get_session_AWS(online, region, endpoint_url)
+    if key not in resources or resources[key][0] is not session:  # rebuilt after reset_connections_AWS
+        with connections_lock:  # creating resources/clients on a shared session is not thread safe
+            resources[key] = (session, session.resource('dynamodb', endpoint_url=key[2], config=connection_config))
+    return resources[key][1]
+
+# Drop every cached session, client and resource (e.g. after the credentials changed)
+def reset_connections_AWS():
+    with connections_lock:
+        connections.clear()
+
 
 def create_sigfox_table_AWS(online, table_name, region, dynamodb=None):
     if not dynamodb:
-        if online:
-            dynamodb = boto3.resource('dynamodb', region_name=region)
-        else:
-            dynamodb = boto3.resource('dynamodb', endpoint_url="http://localhost:8000")
+        dynamodb = get_dynamodb_AWS(online, region)
 
     table = dynamodb.create_table(
         table_name=table_name,
@@ -45,31 +102,102 @@ def create_sigfox_table_AWS(online, table_name, region, dynamodb=None):
 
 def delete_sigfox_table_AWS(online, table_name, region, dynamodb=None):
     if not dynamodb:
-        if online:
-            dynamodb = boto3.resource('dynamodb', region_name=region)
-        else:
-            dynamodb = boto3.resource('dynamodb', endpoint_url="http://localhost:8000")
+        dynamodb = get_dynamodb_AWS(online, region)
 
     table = dynamodb.Table(table_name)
     table.delete()
 
 def scan_items_AWS(online, table_name, region, dynamodb=None):
+    items = []
+    for page in scan_pages_AWS(online, table_name, region, dynamodb=dynamodb):
+        items += page
+    response = {'Items': items, 'Count': len(items)}
+    return response
+
+# Scan one segment of the table, following LastEvaluatedKey and yielding one page (list of items) at a time. attributes
+# limits the items to those attributes (a ProjectionExpression).
+def scan_segment_AWS(online, table_name, region, segment=0, total_segments=1, attributes=None, dynamodb=None):
     if not dynamodb:
-        if online:
-            dynamodb = boto3.resource('dynamodb', region_name=region)
-        else:
-            dynamodb = boto3.resource('dynamodb', endpoint_url="http://localhost:8000")
+        dynamodb = get_dynamodb_AWS(online, region)
 
     table = dynamodb.Table(table_name)
-    response = table.scan()
-    return response
+    scan_kwargs = {}
+    if attributes:
+        names = {'#a%d' % i: attribute for i, attribute in enumerate(attributes)}
+        scan_kwargs['ProjectionExpression'] = ', '.join(names)
+        scan_kwargs['ExpressionAttributeNames'] = names
+    if total_segments > 1:
+        scan_kwargs['Segment'] = segment
+        scan_kwargs['TotalSegments'] = total_segments
+    while True:
+        response = table.scan(**scan_kwargs)
+        yield response['Items']
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+# Scan the whole table page by page - with total_segments > 1 the segments are scanned in parallel on a thread pool
+# and pages are yielded as they arrive. At most max_buffered_pages pages are held in memory at any time.
+def scan_pages_AWS(online, table_name, region, total_segments=1, max_workers=None, max_buffered_pages=8, attributes=None,
+                   dynamodb=None):
+    if total_segments <= 1:
+        yield from scan_segment_AWS(online, table_name, region, attributes=attributes, dynamodb=dynamodb)
+        return
+
+    pages = queue.Queue(maxsize=max_buffered_pages)
+    stop = threading.Event()
+    done = object()
+
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # boto3 resources are not thread safe - get_dynamodb_AWS gives every worker thread its own
+    def scan_segment(segment):
+        try:
+            if stop.is_set():
+                return
+            for page in scan_segment_AWS(online, table_name, region, segment, total_segments, attributes):
+                if not put(page):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or total_segments)
+    try:
+        for segment in range(total_segments):
+            executor.submit(scan_segment, segment)
+        remaining = total_segments
+        while remaining:
+            page = pages.get()
+            if page is done:
+                remaining -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+# Get the IDs of every device in the table - a keys-only scan, so only deviceId comes back over the network (DynamoDB still
+# reads, and charges for, the whole table)
+def scan_device_ids_AWS(online, table_name, region, total_segments=1):
+    devices = set()
+    for page in scan_pages_AWS(online, table_name, region, total_segments=total_segments, attributes=['deviceId']):
+        devices.update(item['deviceId'] for item in page)
+    return devices
 
 def put_item_AWS(online, table_name, deviceId, timestamp, data, temperature, humidity, region, dynamodb=None):
     if not dynamodb:
-        if online:
-            dynamodb = boto3.resource('dynamodb', region_name=region)
-        else:
-            dynamodb = boto3.resource('dynamodb', endpoint_url="http://localhost:8000")
+        dynamodb = get_dynamodb_AWS(online, region)
 
     table = dynamodb.Table(table_name)
     response = table.put_item(
@@ -85,17 +213,108 @@ def put_item_AWS(online, table_name, deviceId, timestamp, data, temperature, hum
     )
     return response
 
+# Write many items with BatchWriteItem - 25 items per request, unprocessed items are retried with exponential backoff (full
+# jitter), and with max_workers > 1 the requests are spread over a thread pool (the low-level client is thread safe).
+# Items can be any iterable (e.g. a generator); at most 2 * max_workers requests are queued at once. Returns the item count.
+def batch_write_items_AWS(online, table_name, items, region, max_workers=1, max_retries=10, base_delay=0.05):
+    client = get_dynamodb_client_AWS(online, region)
+    serializer = TypeSerializer()
+
+    def write_batch(batch):
+        # A request may not contain the same key twice - the last write wins, as it would with put_item
+        batch = list({(item['deviceId'], item['timestamp']): item for item in batch}.values())
+        requests = [{'PutRequest': {'Item': {key: serializer.serialize(value) for key, value in item.items()}}} for item in batch]
+        attempt = 0
+        while requests:
+            response = client.batch_write_item(RequestItems={table_name: requests})
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if requests:
+                if attempt >= max_retries:
+                    raise RuntimeError('%d items still unprocessed after %d retries' % (len(requests), max_retries))
+                time.sleep(random.uniform(0, base_delay * 2 ** attempt))
+                attempt += 1
+        return len(batch)
+
+    items = iter(items)
+    batches = iter(lambda: list(itertools.islice(items, 25)), [])
+    if max_workers <= 1:
+        return sum(write_batch(batch) for batch in batches)
+
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for batch in batches:
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                count += sum(future.result() for future in done)
+            pending.add(executor.submit(write_batch, batch))
+        count += sum(future.result() for future in pending)
+    return count
+
 def query_and_project_items_AWS(online, table_name, deviceId, last_timestamp, region, dynamodb=None):
+    items = list(query_range_AWS(online, table_name, deviceId, region, start=last_timestamp+1, dynamodb=dynamodb))
+    return items
+
+# Query one device's items with start <= timestamp <= end (epoch ms, either bound optional), following LastEvaluatedKey and
+# yielding items one page at a time. newest_first reads the range backwards (ScanIndexForward=False), so
+# limit=N, newest_first=True gives the latest N items without reading the rest of the range.
+def query_range_AWS(online, table_name, deviceId, region, start=None, end=None, limit=None, newest_first=False, page_size=None,
+                    dynamodb=None):
+    if limit == 0:
+        return
+    if not dynamodb:
+        dynamodb = get_dynamodb_AWS(online, region)
+
+    table = dynamodb.Table(table_name)
+    condition = Key('deviceId').eq(deviceId)
+    if start is not None and end is not None:
+        condition = condition & Key('timestamp').between(start, end)
+    elif start is not None:
+        condition = condition & Key('timestamp').gte(start)
+    elif end is not None:
+        condition = condition & Key('timestamp').lte(end)
+    query_kwargs = {
+        'ProjectionExpression': '#id, #ts, payload',
+        'ExpressionAttributeNames': {'#id': 'deviceId', '#ts': 'timestamp'},
+        'KeyConditionExpression': condition,
+        'ScanIndexForward': not newest_first,
+    }
+
+    count = 0
+    while True:
+        page_limit = page_size
+        if limit is not None:
+            page_limit = limit - count if page_limit is None else min(page_limit, limit - count)
+        if page_limit is not None:
+            query_kwargs['Limit'] = page_limit
+        response = table.query(**query_kwargs)
+        for item in response['Items']:
+            yield item
+        count += len(response['Items'])
+        if 'LastEvaluatedKey' not in response or (limit is not None and count >= limit):
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+# Query several devices over the same time window concurrently (at most max_workers queries in flight) and merge the results
+# into one decoded wide frame (deviceId, timestamp, channels). Also returns the query latency in seconds per device.
+def query_devices_AWS(online, table_name, devices, region, start=None, end=None, limit=None, newest_first=False, max_workers=8):
+    def query_device(device):
+        query_start = time.perf_counter()
+        items = list(query_range_AWS(online, table_name, device, region, start=start, end=end, limit=limit, newest_first=newest_first))
+        return items, time.perf_counter() - query_start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(query_device, devices))
+
+    items = [item for device_items, latency in results for item in device_items]
+    latencies = {device: latency for device, (device_items, latency) in zip(devices, results)}
+    df = decoder.decode_items(items)
+
+    return df, latencies
+
+def get_stream_arn_AWS(online, table_name, region, dynamodb=None):
     if not dynamodb:
-        if online:
-            dynamodb = boto3.resource('dynamodb', region_name=region)
-        else:
-            dynamodb = boto3.resource('dynamodb', endpoint_url="http://localhost:8000")
+        dynamodb = get_dynamodb_AWS(online, region)
 
     table = dynamodb.Table(table_name)
-    response = table.query(
-                        ProjectionExpression='#id, #ts, payload',
-                        ExpressionAttributeNames={'#id': 'deviceId', '#ts': 'timestamp'},
-                        KeyConditionExpression=Key('deviceId').eq(deviceId) & Key('timestamp').between(last_timestamp+1, 99999999999999)
-               )
-    return response['Items']
+    return table.latest_stream_arn
@@ -1,8 +1,17 @@
 #Imports=========================================================================================================================#
 import pandas as pd
 from datetime import datetime
+import asyncio
+import functools
+import json
+import os
+import signal
 import time
 import aws_api
+import aws_stream
+import decoder
+import dedup
+import storage
 
 
 
@@ -10,33 +19,232 @@ import aws_api
 def now():
     return round(datetime.timestamp(datetime.now()))
 
-def write_data_to_csv(filename):
-    data_types = ['ch1', 'ch2', 'ch3', 'ch4', 'ch5']
-    num_data_types = len(data_types)
-    columns = ['location', 'deviceId', 'timestamp', 'data', 'value']
-    df = pd.DataFrame(columns=columns)
-    all_msgs = aws_api.scan_items_AWS(online, tableName)['Items']
-    num_all_msgs = len(all_msgs)
-    for i in range(num_all_msgs):
-        item_dict = {'location': 'SA', 'deviceId': all_msgs[i]['deviceId'],
-                     'timestamp': datetime.fromtimestamp(int(all_msgs[i]['timestamp']/1000))}
-        for k in range(num_data_types):
-            item_dict['data'] = data_types[k]
-            item_dict['value'] = int(all_msgs[i]['payload']['data'][k*4+4:k*4+8], 16)
-            df.loc[i * num_data_types + k] = item_dict
+# Convert a list of raw DynamoDB items into the long-format sensor dataframe
+def get_df_from_items(items):
+    df = decoder.decode_items(items)
+    df = decoder.to_long(df, location)
+
+    return df
+
+# Get the highest timestamp per device from a list of raw DynamoDB items
+def get_watermarks_from_items(items, watermarks=None):
+    if watermarks is None:
+        watermarks = {}
+    for item in items:
+        device = item['deviceId']
+        timestamp = int(item['timestamp'])
+        if timestamp > watermarks.get(device, 0):
+            watermarks[device] = timestamp
+
+    return watermarks
+
+# Read the per-device watermarks (highest synced timestamp) from disk
+def read_watermarks(filename):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r') as file:
+        watermarks = json.load(file)
+
+    return {device: int(timestamp) for device, timestamp in watermarks.items()}
+
+# Write the per-device watermarks to disk - written to a temp file first so a crash never leaves a torn file
+def write_watermarks(filename, watermarks):
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as file:
+        json.dump(watermarks, file, indent=4, sort_keys=True)
+    os.replace(temp_filename, filename)
+
+# Scan the whole table and rewrite the local store - pages are decoded as they stream in, so the raw items are never all held at once
+def write_data_to_store(store):
+    dfs = []
+    watermarks = {}
+    deduplicator = dedup.Deduplicator(dedup_window)
+    for page in aws_api.scan_pages_AWS(online, tableName, region, total_segments=scan_segments):
+        dfs.append(get_df_from_items(deduplicator.filter(page)))
+        get_watermarks_from_items(page, watermarks)
+    df = pd.concat(dfs, ignore_index=True) if dfs else get_df_from_items([])
     df = df.sort_values(by=['timestamp', 'deviceId', 'data'], ascending=True)
-    df.to_csv(filename, index=False, header=True)
+    store.write(df)
+
+    return watermarks
+
+# Get the devices in the table that are not in watermarks yet (deployed since they were last looked for)
+def discover_devices(watermarks):
+    return sorted(aws_api.scan_device_ids_AWS(online, tableName, region, total_segments=scan_segments) - set(watermarks))
+
+# Get the devices to query: every device seen so far plus the ones listed in data_locations.csv (those start from zero)
+def get_devices(watermarks):
+    devices = set(watermarks)
+    devices.update(pd.read_csv(locations_filename, dtype={'deviceid': str})['deviceid'])
+
+    return sorted(devices)
+
+
+
+#Pipeline========================================================================================================================#
+# The ingestion daemon runs three stages connected by bounded queues:
+#   fetch   - gets new raw items from DynamoDB (per-device queries, full scans or the table's stream)
+#   decode  - turns them into long-format rows
+#   persist - appends the rows to the local store and then advances the persisted watermarks
+# A full queue blocks the stage in front of it (backpressure), and the blocking boto3/pandas/disk calls run in worker threads,
+# so a slow disk write never holds up the next network fetch. A None on a queue tells the next stage to finish, and if a
+# stage fails the others are cancelled and its error is raised, rather than leaving them blocked on a queue nobody serves.
+# 'fetched' watermarks move as soon as items are queued, so the next poll does not ask for them again; the watermarks on
+# disk only move once the rows are stored, so a restart re-fetches anything that was still in flight.
+
+# Wait for the sampling interval, returning early on shutdown
+async def wait(stop, interval):
+    try:
+        await asyncio.wait_for(stop.wait(), interval)
+    except asyncio.TimeoutError:
+        pass
+
+# Run a blocking call in the default thread pool (asyncio.to_thread needs Python 3.9)
+async def run_in_thread(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+# Fetch stage for 'incremental' mode - per-device queries, at most max_concurrent_queries in flight. Devices that are neither
+# synced yet nor in data_locations.csv are picked up by a keys-only scan every discovery_interval seconds (the first one
+# right away, unless discovered_at says the table was just scanned) and then queried from their first item.
+async def fetch_incremental(fetched, fetch_queue, stop, once=False, discovered_at=None):
+    semaphore = asyncio.Semaphore(max_concurrent_queries)
+
+    async def fetch_device(device):
+        async with semaphore:
+            return await run_in_thread(aws_api.query_and_project_items_AWS, online, tableName, device, fetched.get(device, 0), region)
+
+    while not stop.is_set():
+        if discovery_interval is not None and (discovered_at is None or time.monotonic() - discovered_at >= discovery_interval):
+            discovered_at = time.monotonic()
+            for device in await run_in_thread(discover_devices, fetched):
+                fetched[device] = 0
+        results = await asyncio.gather(*[fetch_device(device) for device in get_devices(fetched)])
+        items = [item for result in results for item in result]
+        if items:
+            get_watermarks_from_items(items, fetched)
+            await fetch_queue.put(items)
+        if once:
+            break
+        await wait(stop, sampling_rate)
+
+# Fetch stage for 'stream' mode - the consumer polls in a worker thread and hands items over to the event loop
+async def fetch_stream(fetched, fetch_queue, stop):
+    loop = asyncio.get_running_loop()
+
+    def on_items(items):
+        items = [item for item in items if int(item['timestamp']) > fetched.get(item['deviceId'], 0)]
+        if items:
+            get_watermarks_from_items(items, fetched)
+            asyncio.run_coroutine_threadsafe(fetch_queue.put(items), loop).result()  # blocks the consumer while the queue is full
+
+    reader = aws_stream.FileStreamReader(stream_filename) if stream_filename else aws_stream.DynamoDBStreamReader(online, tableName, region)
+    consumer = aws_stream.StreamConsumer(reader, checkpoint_filename, on_items)
+    while not stop.is_set():
+        if not await run_in_thread(consumer.poll):
+            await wait(stop, sampling_rate)
+
+# Fetch stage - runs until shutdown, then tells decode to finish
+async def fetch(fetched, fetch_queue, stop, discovered_at=None):
+    if sync_mode == 'stream':
+        # Catch up by query first - the stream only keeps the last 24 hours (new devices then show up in the stream)
+        await fetch_incremental(fetched, fetch_queue, stop, once=True, discovered_at=discovered_at)
+        await fetch_stream(fetched, fetch_queue, stop)
+    else:
+        await fetch_incremental(fetched, fetch_queue, stop, discovered_at=discovered_at)
+    await fetch_queue.put(None)
+
+# Decode stage - repeated frames are dropped here, before they reach the store
+async def decode(fetch_queue, persist_queue):
+    deduplicator = dedup.Deduplicator(dedup_window)
+    while True:
+        items = await fetch_queue.get()
+        if items is None:
+            break
+        df = await run_in_thread(get_df_from_items, deduplicator.filter(items))
+        await persist_queue.put((items, df))
+    await persist_queue.put(None)
+
+# Persist stage
+async def persist(store, watermarks, persist_queue):
+    while True:
+        entry = await persist_queue.get()
+        if entry is None:
+            break
+        items, df = entry
+        await run_in_thread(store.append, df)
+        get_watermarks_from_items(items, watermarks)
+        await run_in_thread(write_watermarks, watermark_filename, dict(watermarks))
+
+# Run the pipeline stages until all of them finish; the first one to fail cancels the rest and its error is raised
+async def supervise(*stages):
+    tasks = [asyncio.create_task(stage) for stage in stages]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for task in done:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+
+# Run the daemon until SIGINT/SIGTERM, then let the items already fetched drain through decode and persist
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows - Ctrl+C raises KeyboardInterrupt instead
+            pass
+
+    store = storage.get_store()  # backend set in storage.py
+    watermarks = read_watermarks(watermark_filename)
+
+    # Nothing synced yet (or the store was removed) - bootstrap with a full scan
+    discovered_at = None
+    if sync_mode == 'full' or not watermarks or not store.exists():
+        watermarks = await run_in_thread(write_data_to_store, store)
+        write_watermarks(watermark_filename, watermarks)
+        discovered_at = time.monotonic()
+    if sync_mode == 'full':
+        while not stop.is_set():
+            await wait(stop, sampling_rate)
+            if not stop.is_set():
+                write_watermarks(watermark_filename, await run_in_thread(write_data_to_store, store))
+        return
+
+    fetch_queue = asyncio.Queue(maxsize=queue_size)
+    persist_queue = asyncio.Queue(maxsize=queue_size)
+    fetched = dict(watermarks)
+    await supervise(fetch(fetched, fetch_queue, stop, discovered_at), decode(fetch_queue, persist_queue),
+                    persist(store, watermarks, persist_queue))
 
 
 
 #Variables=======================================================================================================================#
 tableName = 'Sigfox'
+location = 'SA'
 online = 1
-sampling_rate = 1  # in seconds
+region = None  # None falls back to the region set in ~/.aws/config
+sampling_rate = 1  # in seconds - how long to wait between polls when there is nothing new
+scan_segments = 4  # parallel DynamoDB scan segments used for a full reload
+max_concurrent_queries = 16  # per-device queries in flight at once
+discovery_interval = 3600  # in seconds - how often 'incremental' mode scans the table's keys for new devices (None: never)
+queue_size = 8  # batches buffered between the pipeline stages before the stage in front has to wait
+dedup_window = 24 * 3600 * 1000  # in ms - how far back repeated frames are recognised
+sync_mode = 'incremental'  # 'incremental' queries only new items per device, 'full' rescans the whole table every pass,
+                           # 'stream' reads new items from the table's DynamoDB stream as they arrive
+watermark_filename = '../data/watermarks.json'
+checkpoint_filename = '../data/stream_checkpoints.json'
+stream_filename = None  # set to a file of stream records (one JSON record per line) to replay it instead of the real stream
+locations_filename = '../data/data_locations.csv'
 
 
 
-#Loop============================================================================================================================#
-while True:
-    write_data_to_csv('../data/sensor_data.csv')
-    time.sleep(sampling_rate)  # THIS IS VERY BAD - requires a Lambda callback to notify the app when entries are made in DynamoDB
+#Main============================================================================================================================#
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,110 @@
+#Imports=========================================================================================================================#
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+import aws_api
+import decoder
+
+
+
+#Cache===========================================================================================================================#
+# Read-through LRU cache of decoded query_range_AWS results, keyed by (online, region, table, deviceId, start, end, limit,
+# newest_first) and bounded by the memory of the cached frames. The returned frames are shared - treat them as read-only.
+#   - Closed windows (end more than closed_after seconds in the past) can no longer change and are kept until evicted.
+#   - Open-ended windows expire after ttl seconds, and are dropped as soon as the device's watermark moves past the one they
+#     were filled at. Watermarks come from notify_watermarks() and from the watermarks file aws_app writes after every
+#     stored batch, so the dashboard process sees new data without sharing memory with aws_app.
+class QueryCache:
+
+    def __init__(self, max_bytes=64 * 2**20, ttl=60, closed_after=600, watermark_filename='../data/watermarks.json'):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.closed_after = closed_after
+        self.watermark_filename = watermark_filename
+        self.watermark_mtime = None
+        self.watermarks = {}
+        self.entries = OrderedDict()
+        self.num_bytes = 0
+        self.lock = threading.Lock()
+
+    def is_closed(self, end):
+        return end is not None and end < (time.time() - self.closed_after) * 1000
+
+    def query(self, online, table_name, deviceId, region, start=None, end=None, limit=None, newest_first=False):
+        self.read_watermark_file()
+        key = (online, region, table_name, deviceId, start, end, limit, newest_first)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and (entry['expires'] is None or entry['expires'] > time.time()):
+                self.entries.move_to_end(key)
+                return entry['df']
+            if entry:
+                self.remove(key)
+            watermark = self.watermarks.get(deviceId, 0)
+
+        items = list(aws_api.query_range_AWS(online, table_name, deviceId, region, start, end, limit, newest_first))
+        df = decoder.decode_items(items)
+
+        with self.lock:
+            if self.watermarks.get(deviceId, 0) == watermark:  # skip results that went stale while querying
+                expires = None if self.is_closed(end) else time.time() + self.ttl
+                self.add(key, {'df': df, 'bytes': int(df.memory_usage(deep=True).sum()), 'expires': expires})
+
+        return df
+
+    def add(self, key, entry):
+        if entry['bytes'] > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.num_bytes += entry['bytes']
+        while self.num_bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        self.num_bytes -= self.entries.pop(key)['bytes']
+
+    # Drop the open-ended entries of one device
+    def invalidate_device(self, deviceId, table_name=None):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if key[3] == deviceId and entry['expires'] is not None
+                        and (table_name is None or key[2] == table_name)]:
+                self.remove(key)
+
+    # Invalidate the devices whose watermark (highest stored timestamp) has moved
+    def notify_watermarks(self, watermarks):
+        for deviceId, watermark in watermarks.items():
+            if watermark > self.watermarks.get(deviceId, 0):
+                with self.lock:
+                    self.watermarks[deviceId] = watermark
+                self.invalidate_device(deviceId)
+
+    # Pick up the watermarks aws_app has persisted since the last check (only re-read when the file changed)
+    def read_watermark_file(self):
+        if not self.watermark_filename:
+            return
+        try:
+            mtime = os.stat(self.watermark_filename).st_mtime_ns
+            if mtime == self.watermark_mtime:
+                return
+            with open(self.watermark_filename, 'r') as file:
+                watermarks = json.load(file)
+        except (OSError, ValueError):
+            return
+        self.watermark_mtime = mtime
+        self.notify_watermarks({deviceId: int(watermark) for deviceId, watermark in watermarks.items()})
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.num_bytes = 0
+
+
+
+#Functions=======================================================================================================================#
+cache = QueryCache()
+
+# query_range_AWS through the shared cache, decoded into a wide frame
+def query_range_cached_AWS(online, table_name, deviceId, region, start=None, end=None, limit=None, newest_first=False):
+    return cache.query(online, table_name, deviceId, region, start, end, limit, newest_first)
@@ -0,0 +1,195 @@
+#Imports=========================================================================================================================#
+from boto3.dynamodb.types import TypeDeserializer
+import json
+import os
+import time
+import aws_api
+
+
+
+# Raised by a reader when a shard iterator has expired (they are only valid for 15 minutes) or points at records that have
+# been trimmed - the consumer then restarts the shard from its checkpoint
+class IteratorExpired(Exception):
+    pass
+
+
+
+#Functions=======================================================================================================================#
+# Convert a stream image (DynamoDB JSON, e.g. {'deviceId': {'S': '22229D5'}}) into a plain item like table.scan() returns
+def deserialize_image(image):
+    deserializer = TypeDeserializer()
+
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
+
+# Read the per-shard checkpoints (last processed sequence number, and the shards that have been read to the end)
+def read_checkpoints(filename):
+    if not os.path.exists(filename):
+        return {'sequence_numbers': {}, 'closed_shards': []}
+    with open(filename, 'r') as file:
+        return json.load(file)
+
+# Order (shard id, parent shard id) pairs by lineage, parents before children. Shards whose parent is no longer listed (trimmed
+# after 24 hours) count as roots.
+def order_shards(shards):
+    shard_ids = set(shard_id for shard_id, parent_id in shards)
+    children = {}
+    for shard_id, parent_id in shards:
+        children.setdefault(parent_id if parent_id in shard_ids else None, []).append((shard_id, parent_id))
+    ordered = []
+    pending = list(children.get(None, []))
+    while pending:
+        shard = pending.pop(0)
+        ordered.append(shard)
+        pending += children.get(shard[0], [])
+
+    return ordered
+
+# Write the checkpoints to disk - written to a temp file first so a crash never leaves a torn file
+def write_checkpoints(filename, checkpoints):
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'w') as file:
+        json.dump(checkpoints, file, indent=4, sort_keys=True)
+    os.replace(temp_filename, filename)
+
+
+
+#Readers=========================================================================================================================#
+# Reads the shards of the table's DynamoDB stream (enabled in create_sigfox_table_AWS with NEW_AND_OLD_IMAGES)
+class DynamoDBStreamReader:
+
+    def __init__(self, online, table_name, region):
+        self.client = aws_api.get_dynamodb_client_AWS(online, region, service_name='dynamodbstreams')
+        self.stream_arn = aws_api.get_stream_arn_AWS(online, table_name, region)
+
+    # Get the (shard id, parent shard id) pairs, parents before children
+    def list_shards(self):
+        shards = []
+        kwargs = {'StreamArn': self.stream_arn}
+        while True:
+            description = self.client.describe_stream(**kwargs)['StreamDescription']
+            shards += description['Shards']
+            if 'LastEvaluatedShardId' not in description:
+                break
+            kwargs['ExclusiveStartShardId'] = description['LastEvaluatedShardId']
+
+        return order_shards([(shard['ShardId'], shard.get('ParentShardId')) for shard in shards])
+
+    # Get an iterator just after the checkpointed record, or at the oldest record still in the shard when there is no
+    # checkpoint or the checkpointed record has been trimmed (after more than 24 hours offline)
+    def get_iterator(self, shard_id, sequence_number=None):
+        kwargs = {'StreamArn': self.stream_arn, 'ShardId': shard_id, 'ShardIteratorType': 'TRIM_HORIZON'}
+        if sequence_number:
+            try:
+                return self.client.get_shard_iterator(**dict(kwargs, ShardIteratorType='AFTER_SEQUENCE_NUMBER',
+                                                              SequenceNumber=sequence_number))['ShardIterator']
+            except self.client.exceptions.TrimmedDataAccessException:
+                pass
+
+        return self.client.get_shard_iterator(**kwargs)['ShardIterator']
+
+    # Get the next records and the iterator to continue from (None once a closed shard has been read to the end)
+    def get_records(self, iterator, limit=1000):
+        try:
+            response = self.client.get_records(ShardIterator=iterator, Limit=limit)
+        except (self.client.exceptions.ExpiredIteratorException, self.client.exceptions.TrimmedDataAccessException):
+            raise IteratorExpired(iterator)
+
+        return response['Records'], response.get('NextShardIterator')
+
+# Local stand-in for DynamoDBStreamReader: one shard fed from a file with one stream record (as returned by GetRecords)
+# per line. Lines appended to the file are picked up by the next get_records call, like new items on a real stream.
+class FileStreamReader:
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def list_shards(self):
+        return [('file', None)]
+
+    def read_records(self):
+        if not os.path.exists(self.filename):
+            return []
+        with open(self.filename, 'r') as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    def get_iterator(self, shard_id, sequence_number=None):
+        if not sequence_number:
+            return 0
+        sequence_numbers = [record['dynamodb']['SequenceNumber'] for record in self.read_records()]
+
+        return sequence_numbers.index(sequence_number) + 1 if sequence_number in sequence_numbers else 0
+
+    def get_records(self, iterator, limit=1000):
+        records = self.read_records()[iterator:iterator + limit]
+
+        return records, iterator + len(records)
+
+
+
+#Consumer========================================================================================================================#
+# Polls every shard of a stream reader, hands the new/updated items to on_items and checkpoints the last sequence number per
+# shard once on_items has returned, so a restart resumes after the last item that was handed over. If on_items only queues the
+# items, the caller has to recover the ones still queued at a crash itself (aws_app re-queries everything newer than its
+# stored watermarks on start-up).
+class StreamConsumer:
+
+    def __init__(self, reader, checkpoint_filename, on_items):
+        self.reader = reader
+        self.checkpoint_filename = checkpoint_filename
+        self.on_items = on_items
+        self.checkpoints = read_checkpoints(checkpoint_filename)
+        self.iterators = {}
+
+    # Read each open shard once - returns the number of records read
+    def poll(self):
+        num_records = 0
+        sequence_numbers = self.checkpoints['sequence_numbers']
+        closed_shards = self.checkpoints['closed_shards']
+        shards = self.reader.list_shards()
+        shard_ids = [shard_id for shard_id, parent_id in shards]
+        for shard_id, parent_id in shards:
+            if shard_id in closed_shards:
+                continue
+            # A child holds newer records than its parent - start it only once the parent has been read to the end, so the
+            # fetched watermarks never move past records still waiting in the parent
+            if parent_id in shard_ids and parent_id not in closed_shards:
+                continue
+            iterator = self.iterators.get(shard_id)
+            if iterator is None:
+                iterator = self.reader.get_iterator(shard_id, sequence_numbers.get(shard_id))
+            try:
+                records, next_iterator = self.reader.get_records(iterator)
+            except IteratorExpired:
+                self.iterators.pop(shard_id, None)
+                continue
+
+            items = [deserialize_image(record['dynamodb']['NewImage']) for record in records
+                     if record['eventName'] in ('INSERT', 'MODIFY') and 'NewImage' in record['dynamodb']]
+            if items:
+                self.on_items(items)
+            if records:
+                sequence_numbers[shard_id] = records[-1]['dynamodb']['SequenceNumber']
+            if next_iterator is None:
+                closed_shards.append(shard_id)
+                self.iterators.pop(shard_id, None)
+            else:
+                self.iterators[shard_id] = next_iterator
+            if records or next_iterator is None:
+                write_checkpoints(self.checkpoint_filename, self.checkpoints)
+            num_records += len(records)
+
+        # Shards are trimmed from the stream after 24 hours - forget their checkpoints too
+        expired_shards = [shard_id for shard_id in sequence_numbers if shard_id not in shard_ids]
+        if expired_shards:
+            for shard_id in expired_shards:
+                del sequence_numbers[shard_id]
+            self.checkpoints['closed_shards'] = [shard_id for shard_id in closed_shards if shard_id in shard_ids]
+            write_checkpoints(self.checkpoint_filename, self.checkpoints)
+
+        return num_records
+
+    # Poll forever - only waits when every shard is caught up
+    def run(self, idle_interval=1):
+        while True:
+            if not self.poll():
+                time.sleep(idle_interval)
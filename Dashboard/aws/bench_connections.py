@@ -0,0 +1,44 @@
+#Imports=========================================================================================================================#
+import time
+import boto3
+import aws_api
+
+
+
+#Functions=======================================================================================================================#
+# Per-call latency when every call builds a new resource (what aws_api did before the connection cache)
+def time_fresh_resource(table_name, region, endpoint_url, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        dynamodb = boto3.resource('dynamodb', region_name=region, endpoint_url=endpoint_url)
+        dynamodb.Table(table_name).scan(Limit=1)
+
+    return (time.perf_counter() - start) / calls
+
+# Per-call latency through the shared connection cache
+def time_cached_resource(table_name, region, endpoint_url, calls):
+    aws_api.get_dynamodb_AWS(online, region, endpoint_url).Table(table_name).scan(Limit=1)  # warm up
+    start = time.perf_counter()
+    for i in range(calls):
+        dynamodb = aws_api.get_dynamodb_AWS(online, region, endpoint_url)
+        dynamodb.Table(table_name).scan(Limit=1)
+
+    return (time.perf_counter() - start) / calls
+
+
+
+#Variables=======================================================================================================================#
+tableName = 'Sigfox'
+online = 0  # 0 runs against DynamoDB Local (java -jar DynamoDBLocal.jar -inMemory -port 8000)
+region = 'us-east-1'
+endpoint_url = None if online else aws_api.local_endpoint_url
+calls = 200
+
+
+
+#Main============================================================================================================================#
+if __name__ == '__main__':
+    fresh = time_fresh_resource(tableName, region, endpoint_url, calls)
+    cached = time_cached_resource(tableName, region, endpoint_url, calls)
+    print('fresh resource:  %.2f ms/call' % (fresh * 1000))
+    print('cached resource: %.2f ms/call' % (cached * 1000))
@@ -0,0 +1,54 @@
+#Imports=========================================================================================================================#
+from datetime import datetime
+from decimal import Decimal
+import time
+import numpy as np
+import pandas as pd
+import decoder
+
+
+
+#Functions=======================================================================================================================#
+# Build num_items fake DynamoDB items shaped like the Sigfox callback payload
+def make_items(num_items, num_devices=300):
+    rng = np.random.default_rng(0)
+    payloads = rng.integers(0, 2**16, size=(num_items, 6), dtype=np.uint16).astype('>u2')
+    devices = ['%07X' % (0x22229D5 + i) for i in range(num_devices)]
+    items = []
+    for i in range(num_items):
+        items.append({'deviceId': devices[i % num_devices],
+                      'timestamp': Decimal(1615202000000 + i * 1000),
+                      'payload': {'data': payloads[i].tobytes().hex()}})
+
+    return items
+
+# The row-by-row decoder that aws_app used before decoder.py, kept for comparison
+def decode_items_loop(items):
+    data_types = decoder.data_types
+    num_data_types = len(data_types)
+    df = pd.DataFrame(columns=['location', 'deviceId', 'timestamp', 'data', 'value'])
+    for i in range(len(items)):
+        item_dict = {'location': 'SA', 'deviceId': items[i]['deviceId'],
+                     'timestamp': datetime.fromtimestamp(int(items[i]['timestamp']/1000))}
+        for k in range(num_data_types):
+            item_dict['data'] = data_types[k]
+            item_dict['value'] = int(items[i]['payload']['data'][k*4+4:k*4+8], 16)
+            df.loc[i * num_data_types + k] = item_dict
+
+    return df
+
+def bench(function, items):
+    start = time.perf_counter()
+    function(items)
+    elapsed = time.perf_counter() - start
+    print('%-12s %9d msgs %9.3f s %12.0f msgs/s' % (function.__name__, len(items), elapsed, len(items) / elapsed))
+
+
+
+#Main============================================================================================================================#
+if __name__ == '__main__':
+    bench(decode_items_loop, make_items(10**2))  # quadratic - only a small sample
+    for num_items in (10**4, 10**5, 10**6):
+        items = make_items(num_items)
+        bench(decoder.decode_items, items)
+        bench(lambda items: decoder.to_long(decoder.decode_items(items)), items)
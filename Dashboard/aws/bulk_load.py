@@ -0,0 +1,52 @@
+#Imports=========================================================================================================================#
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+import aws_api
+import decoder
+import storage
+
+
+
+#Functions=======================================================================================================================#
+# Read historical long-format sensor data (location, deviceId, timestamp, data, value) from a csv file, a Parquet file, or a
+# partitioned Parquet/Arrow store directory written by storage.py
+def read_history(path):
+    if os.path.isdir(path):
+        if any(filename.endswith('.arrow') for _, _, filenames in os.walk(path) for filename in filenames):
+            return storage.ArrowStore(path).read()
+        return storage.ParquetStore(path).read()
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+
+    return storage.CsvStore(path).read()
+
+# Rebuild the raw DynamoDB items (one per message) from long-format rows, chunk_size messages at a time
+def get_items(df_long, chunk_size=10000):
+    df = decoder.to_wide(df_long)
+    channels = df[decoder.data_types].fillna(0).to_numpy().astype(np.uint16)
+    for start in range(0, len(df), chunk_size):
+        df_chunk = df.iloc[start:start + chunk_size]
+        payloads = decoder.encode_payloads(pd.DataFrame(channels[start:start + chunk_size], columns=decoder.data_types))
+        for deviceId, timestamp, payload in zip(df_chunk['deviceId'], df_chunk['timestamp'], payloads):
+            yield {'deviceId': str(deviceId), 'timestamp': int(timestamp), 'payload': {'data': payload}}
+
+
+
+#Main============================================================================================================================#
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk-load historical sensor data into the Sigfox DynamoDB table.')
+    parser.add_argument('path', help='csv file, Parquet file, or Parquet/Arrow store directory')
+    parser.add_argument('--table', default='Sigfox')
+    parser.add_argument('--region', default=None, help='defaults to the region in ~/.aws/config')
+    parser.add_argument('--offline', action='store_true', help='load into DynamoDB Local at ' + aws_api.local_endpoint_url)
+    parser.add_argument('--workers', type=int, default=8, help='concurrent BatchWriteItem requests')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    items = get_items(read_history(args.path))
+    count = aws_api.batch_write_items_AWS(not args.offline, args.table, items, args.region, max_workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print('%d items written in %.1f s (%.0f items/s)' % (count, elapsed, count / elapsed if elapsed else 0))
@@ -0,0 +1,57 @@
+#Imports=========================================================================================================================#
+import os
+import sys
+import tempfile
+import pandas as pd
+import storage
+
+
+
+#Functions=======================================================================================================================#
+# A few messages from two devices over two days, with sub-second timestamps and fractional (scaled) values
+def make_df():
+    timestamps = pd.date_range('2021-03-08 23:59:58', periods=6, freq='1234ms')
+    df = pd.DataFrame({'location': 'SA', 'deviceId': ['22229D5', '22229D6'] * 3, 'timestamp': timestamps,
+                       'data': 'temperature', 'value': [23.5, 24.9, 0.0, 65535.0, -1.25, 3.0]})
+
+    return df
+
+# Append df to a store and read it back (whole history, then one device from a start time), raising if anything changed
+def check_round_trip(name, store, df):
+    store.append(df)
+    store.append(df.iloc[:0])
+    expected = df.sort_values(by=['timestamp', 'deviceId'], kind='mergesort', ignore_index=True)
+    actual = store.read()
+    for column in storage.categorical_columns:
+        actual[column] = actual[column].astype(str)
+    pd.testing.assert_frame_equal(actual[storage.store_columns], expected[storage.store_columns], check_dtype=False)
+    assert pd.api.types.is_datetime64_dtype(actual['timestamp']), actual['timestamp'].dtype
+
+    start = expected['timestamp'].iloc[2]
+    actual = store.read(devices=['22229D6'], start=start, channels=['temperature'])
+    expected = expected[(expected['deviceId'] == '22229D6') & (expected['timestamp'] >= start)]
+    assert actual['timestamp'].tolist() == expected['timestamp'].tolist(), actual
+    assert actual['value'].tolist() == expected['value'].tolist(), actual
+    print('%-8s ok' % name)
+
+
+
+#Main============================================================================================================================#
+# Check every backend round-trips timestamps and values with the installed pandas/pyarrow (run after changing either pin)
+if __name__ == '__main__':
+    print('pandas %s' % pd.__version__)
+    with tempfile.TemporaryDirectory() as root:
+        stores = {
+            'csv': lambda: storage.CsvStore(os.path.join(root, 'sensor_data.csv')),
+            'parquet': lambda: storage.ParquetStore(os.path.join(root, 'parquet')),
+            'arrow': lambda: storage.ArrowStore(os.path.join(root, 'arrow')),
+            'sqlite': lambda: storage.SqliteStore(os.path.join(root, 'sensor_data.db')),
+        }
+        failed = False
+        for name, create in stores.items():
+            try:
+                check_round_trip(name, create(), make_df())
+            except Exception as e:
+                print('%-8s FAILED: %s: %s' % (name, type(e).__name__, e))
+                failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,172 @@
+#Imports=========================================================================================================================#
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+
+
+#Payload Schemas=================================================================================================================#
+# A schema describes the layout of one frame as an ordered list of fields. Each field has a numpy type code (big-endian unless
+# the code says otherwise: 'u1', 'i2', 'u4', 'f4', '<u2', ...) and is either
+#   - a channel:   {'name': 'ch1', 'type': 'u2', 'scale': 0.1, 'offset': -40}   (scale/offset optional)
+#   - bitfields:   {'name': 'status', 'type': 'u1', 'bits': {'battery_low': (0, 1), 'mode': (1, 3)}}   (name: (shift, width))
+#   - padding:     {'name': None, 'type': 'u2'}
+# Schemas are resolved per message by deviceId first, then by frame type (the first payload byte), then the default schema.
+schemas = {}
+device_schemas = {}
+frame_type_schemas = {}
+compiled_schemas = {}
+default_schema = 'sigfox_v1'
+epoch = datetime(1970, 1, 1)
+
+# Register (or replace) a schema, optionally binding it to a frame type byte and/or a list of devices
+def register_schema(name, fields, frame_type=None, devices=()):
+    schemas[name] = fields
+    compiled_schemas.pop(name, None)
+    if frame_type is not None:
+        frame_type_schemas[frame_type] = name
+    for device in devices:
+        device_schemas[device] = name
+
+# Compile a schema into a structured dtype plus the list of output columns - compiled once and cached per schema
+def compile_schema(name):
+    if name in compiled_schemas:
+        return compiled_schemas[name]
+
+    dtype_fields = []
+    columns = []
+    for i, field in enumerate(schemas[name]):
+        code = field['type'] if field['type'][0] in '<>|=' else '>' + field['type']
+        field_name = field['name'] or '_pad%d' % i
+        dtype_fields.append((field_name, code))
+        if field.get('bits'):
+            for bit_name, (shift, width) in field['bits'].items():
+                columns.append({'name': bit_name, 'field': field_name, 'shift': shift, 'mask': (1 << width) - 1})
+        elif field['name']:
+            columns.append({'name': field_name, 'field': field_name, 'scale': field.get('scale'), 'offset': field.get('offset')})
+
+    dtype = np.dtype(dtype_fields)
+    compiled = {'dtype': dtype, 'hex_length': dtype.itemsize * 2, 'columns': columns}
+    compiled_schemas[name] = compiled
+
+    return compiled
+
+# Get the schema name for one message
+def get_schema_name(deviceId, payload):
+    if deviceId in device_schemas:
+        return device_schemas[deviceId]
+    if frame_type_schemas and payload:
+        return frame_type_schemas.get(int(payload[:2], 16), default_schema)
+
+    return default_schema
+
+# The 12-byte ul_msg sent by the firmware's AT_SendFrame: a 16-bit header followed by five big-endian 16-bit channels
+data_types = ['ch1', 'ch2', 'ch3', 'ch4', 'ch5']
+register_schema(default_schema, [{'name': None, 'type': 'u2'}] + [{'name': data_type, 'type': 'u2'} for data_type in data_types])
+
+
+
+#Functions=======================================================================================================================#
+# Decode the payloads of messages that share one schema into a dict of columns
+def decode_payloads(payloads, name):
+    compiled = compile_schema(name)
+    hex_length = compiled['hex_length']
+    payloads = ''.join([payload[:hex_length].ljust(hex_length, '0') for payload in payloads])
+    records = np.frombuffer(bytes.fromhex(payloads), dtype=compiled['dtype'])
+
+    columns = {}
+    for column in compiled['columns']:
+        values = records[column['field']]
+        values = values.astype(values.dtype.newbyteorder('='))
+        if 'mask' in column:
+            values = (values >> column['shift']) & column['mask']
+        elif column['scale'] is not None or column['offset'] is not None:
+            values = values * (1 if column['scale'] is None else column['scale']) + (column['offset'] or 0)
+        columns[column['name']] = values
+
+    return columns
+
+# Decode a list of raw DynamoDB items into a wide frame with one row per message (deviceId, timestamp in epoch ms, channels).
+# Payloads are grouped by schema and each group is joined into one hex string and viewed as a structured array, so there
+# is no per-channel Python work.
+def decode_items(items):
+    num_items = len(items)
+    devices = [item['deviceId'] for item in items]
+    payloads = [item['payload']['data'] for item in items]
+    df = pd.DataFrame({
+        'deviceId': devices,
+        'timestamp': np.fromiter((int(item['timestamp']) for item in items), dtype=np.int64, count=num_items),
+    })
+
+    if not device_schemas and not frame_type_schemas:
+        df = df.assign(**decode_payloads(payloads, default_schema))
+        return df
+
+    names = np.array([get_schema_name(device, payload) for device, payload in zip(devices, payloads)])
+    groups = []
+    for name in np.unique(names):
+        index = np.flatnonzero(names == name)
+        groups.append(pd.DataFrame(decode_payloads([payloads[i] for i in index], name), index=index))
+    df = df.join(pd.concat(groups).sort_index())
+
+    return df
+
+# Convert epoch milliseconds to naive local datetimes truncated to the second (as datetime.fromtimestamp(ts/1000) did).
+# The UTC offset is looked up once per quarter hour present in the data rather than once per message.
+def to_local_datetimes(timestamps):
+    seconds = np.asarray(timestamps, dtype=np.int64) // 1000
+    quarters, inverse = np.unique(seconds // 900, return_inverse=True)
+    offsets = np.array([(datetime.fromtimestamp(quarter * 900) - epoch).total_seconds() - quarter * 900 for quarter in quarters],
+                       dtype=np.int64)
+    datetimes = pd.to_datetime(seconds + offsets[inverse.ravel()], unit='s')
+
+    return datetimes
+
+# Convert naive local datetimes back to epoch milliseconds (the inverse of to_local_datetimes)
+def from_local_datetimes(datetimes):
+    seconds = pd.to_datetime(pd.Series(datetimes)).to_numpy().astype('datetime64[s]').astype(np.int64)
+    quarters, inverse = np.unique(seconds // 900, return_inverse=True)
+    offsets = np.array([quarter * 900 - (epoch + timedelta(seconds=int(quarter * 900))).timestamp() for quarter in quarters],
+                       dtype=np.int64)
+
+    return (seconds - offsets[inverse.ravel()]) * 1000
+
+# Encode the channels of a wide frame back into payload hex strings of the default schema (the header bytes are zero)
+def encode_payloads(df):
+    records = np.zeros(len(df), dtype=compile_schema(default_schema)['dtype'])
+    for data_type in data_types:
+        records[data_type] = df[data_type].to_numpy()
+    hex_length = compile_schema(default_schema)['hex_length']
+    payloads = records.tobytes().hex()
+
+    return [payloads[i:i + hex_length] for i in range(0, len(payloads), hex_length)]
+
+# Convert long-format rows back into a wide frame with one row per message (deviceId, timestamp in epoch ms, channels).
+# The store reads deviceId and data as Categoricals: observed=True keeps the pivot to the (device, timestamp) pairs that exist
+# rather than every device times every timestamp, and the channel columns become a plain Index so reset_index can add to it.
+def to_wide(df_long):
+    df = df_long.pivot_table(index=['deviceId', 'timestamp'], columns='data', values='value', aggfunc='last', observed=True)
+    df.columns = pd.Index(df.columns.astype(str))
+    df = df.reset_index()
+    df['deviceId'] = df['deviceId'].astype(str)
+    df['timestamp'] = from_local_datetimes(df['timestamp'])
+
+    return df
+
+# Convert a wide decoded frame into the long-format rows of sensor_data.csv (location, deviceId, timestamp, data, value).
+# Channels missing from a message (mixed schemas) are dropped rather than written as empty values.
+def to_long(df, location='SA'):
+    channels = [column for column in df.columns if column not in ('deviceId', 'timestamp')]
+    num_channels = len(channels)
+    df_long = pd.DataFrame({
+        'location': location,
+        'deviceId': np.repeat(df['deviceId'].to_numpy(), num_channels),
+        'timestamp': np.repeat(to_local_datetimes(df['timestamp']), num_channels),
+        'data': np.tile(channels, len(df)),
+        'value': df[channels].to_numpy().ravel(),
+    }, columns=['location', 'deviceId', 'timestamp', 'data', 'value'])
+    if df[channels].isna().to_numpy().any():
+        df_long = df_long.dropna(subset=['value'])
+    df_long = df_long.sort_values(by=['timestamp', 'deviceId', 'data'], ascending=True, kind='mergesort')
+
+    return df_long
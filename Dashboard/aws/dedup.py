@@ -0,0 +1,51 @@
+#Imports=========================================================================================================================#
+import threading
+
+
+
+#Functions=======================================================================================================================#
+# Get the dedup key of a raw item - the Sigfox sequence number (if the callback sends one) tells repeated frames apart from
+# distinct messages that happen to share a timestamp
+def get_key(item):
+    seqNumber = item.get('seqNumber', item.get('payload', {}).get('seqNumber'))
+
+    return (int(item['timestamp']), None if seqNumber is None else int(seqNumber))
+
+
+
+#Deduplicator====================================================================================================================#
+# Drops raw items that were already let through, keyed on (deviceId, timestamp, seqNumber). Sigfox delivers the same frame
+# once per receiving base station, and overlapping fetches (stream replay, restarts, full rescans) return items again.
+# Keys are kept in a rolling set per device covering the last `window` milliseconds before that device's newest item, so
+# memory stays proportional to the message rate rather than the history. Older items cannot be checked and are let through;
+# the incremental and stream modes never fetch below the stored watermark anyway.
+class Deduplicator:
+
+    def __init__(self, window=24 * 3600 * 1000):
+        self.window = window
+        self.devices = {}
+        self.lock = threading.Lock()
+
+    def filter(self, items):
+        new_items = []
+        with self.lock:
+            for item in items:
+                key = get_key(item)
+                device = self.devices.setdefault(item['deviceId'], {'keys': set(), 'newest': key[0], 'pruned_size': 0})
+                if key in device['keys']:
+                    continue
+                new_items.append(item)
+                if key[0] >= device['newest'] - self.window:
+                    device['keys'].add(key)
+                    device['newest'] = max(device['newest'], key[0])
+            for device in self.devices.values():
+                if len(device['keys']) > 2 * device['pruned_size'] + 1024:
+                    self.prune(device)
+
+        return new_items
+
+    # Forget the keys that have fallen out of the window
+    def prune(self, device):
+        oldest = device['newest'] - self.window
+        device['keys'] = {key for key in device['keys'] if key[0] >= oldest}
+        device['pruned_size'] = len(device['keys'])
@@ -0,0 +1,485 @@
+#Imports=========================================================================================================================#
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import pandas as pd
+
+
+
+#Variables=======================================================================================================================#
+# The local copy of the sensor data is written by aws_app.py and read by the dashboard. Both run one folder below Dashboard/,
+# so the paths are relative to that.
+backend = 'arrow'  # 'csv', 'parquet', 'arrow' or 'sqlite'
+csv_filename = '../data/sensor_data.csv'
+parquet_root = '../data/sensor_data'
+arrow_root = '../data/sensor_data_arrow'
+sqlite_filename = '../data/sensor_data.db'
+store_columns = ['location', 'deviceId', 'timestamp', 'data', 'value']
+categorical_columns = ['location', 'deviceId', 'data']  # read as pandas Categorical rather than Python strings
+
+
+
+#Functions=======================================================================================================================#
+# One store per backend and process, so per-thread connections and cached manifests are reused across calls
+stores = {}
+stores_lock = threading.Lock()
+
+# Get the configured storage backend
+def get_store(name=None):
+    name = name or backend
+    with stores_lock:
+        if name not in stores:
+            stores[name] = create_store(name)
+
+        return stores[name]
+
+def create_store(name):
+    if name == 'csv':
+        return CsvStore(csv_filename)
+    if name == 'parquet':
+        return ParquetStore(parquet_root, legacy_csv_filename=csv_filename)
+    if name == 'arrow':
+        return ArrowStore(arrow_root, legacy_csv_filename=csv_filename)
+    if name == 'sqlite':
+        return SqliteStore(sqlite_filename, legacy_csv_filename=csv_filename)
+    raise ValueError('Unknown storage backend: ' + str(name))
+
+# Filter a long-format dataframe by device, time range and channel (for backends that cannot push the filter down)
+def filter_df(df, devices=None, start=None, end=None, channels=None):
+    if devices is not None:
+        df = df[df['deviceId'].isin(list(devices))]
+    if channels is not None:
+        df = df[df['data'].isin(list(channels))]
+    if start is not None:
+        df = df[df['timestamp'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['timestamp'] <= pd.Timestamp(end)]
+
+    return df
+
+
+
+#CSV=============================================================================================================================#
+# The original single csv file - every read parses the whole history
+class CsvStore:
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    # Replace the whole history
+    def write(self, df):
+        df.to_csv(self.filename, index=False, header=True, columns=store_columns)
+
+    # Append new rows
+    def append(self, df):
+        if not self.exists():
+            return self.write(df)
+        df.to_csv(self.filename, mode='a', index=False, header=False, columns=store_columns)
+
+    def read(self, devices=None, start=None, end=None, columns=None, channels=None):
+        flag = False
+        while not flag:
+            try:
+                df = pd.read_csv(self.filename, parse_dates=['timestamp'], dtype={column: 'category' for column in categorical_columns})
+                flag = True
+            except pd.errors.EmptyDataError:
+                pass
+        df = filter_df(df, devices, start, end, channels)
+        if columns:
+            df = df[columns]
+
+        return df.reset_index(drop=True)
+
+    # Get the unique (location, deviceId) pairs
+    def read_devices(self):
+        df = pd.read_csv(self.filename, usecols=['location', 'deviceId'], dtype=str)
+
+        return df.drop_duplicates().reset_index(drop=True)
+
+
+
+#Parquet=========================================================================================================================#
+# Append-only Parquet files, hive-partitioned by device and day:  <root>/deviceId=<id>/date=<YYYY-MM-DD>/<part>.parquet
+# Reads prune partitions by device and day, push the timestamp filter down to the row groups and only decode the requested
+# columns, so a graph refresh for one device touches that device's files only.
+# The live files are listed in <root>/_manifest.json, which is replaced atomically (written under a temporary name and
+# renamed). New and merged files are written first and only then swapped into the manifest, so a reader sees either the old
+# or the new set of files, never a mix. Files dropped from the manifest (by write() or compact()) are deleted retire_after
+# seconds later, and a read that still loses a file to a long-running writer re-reads the manifest and retries.
+class ParquetStore:
+    file_format = 'parquet'
+    dataset_format = 'parquet'
+    manifest_name = '_manifest.json'
+    retire_after = 60
+    read_retries = 5
+
+    def __init__(self, root, legacy_csv_filename=None, max_files_per_partition=32):
+        import pyarrow  # Optional dependency - only needed for this backend
+        self.root = root
+        self.max_files_per_partition = max_files_per_partition
+        self.lock = threading.Lock()  # serializes this process's manifest updates - aws_app is the only writing process
+        self.manifest = None
+        self.manifest_stat = None
+        self.file_locations = {}  # path -> locations in that file, for read_devices
+        if not os.path.exists(os.path.join(root, self.manifest_name)) and self.list_files():
+            self.commit(self.list_files())
+        if not self.exists() and legacy_csv_filename and os.path.exists(legacy_csv_filename):
+            self.append(CsvStore(legacy_csv_filename).read())
+
+    def exists(self):
+        return len(self.read_manifest()['files']) > 0
+
+    def get_schema(self):
+        import pyarrow as pa
+
+        return pa.schema([('location', pa.string()), ('timestamp', pa.timestamp('ms')), ('data', pa.string()),
+                          ('value', pa.float64()), ('deviceId', pa.string()), ('date', pa.string())])
+
+    # The columns stored in each file (deviceId and date come from the partition directories)
+    def get_file_schema(self):
+        import pyarrow as pa
+
+        schema = self.get_schema()
+
+        return pa.schema([field for field in schema if field.name not in ('deviceId', 'date')])
+
+    def get_partitioning(self):
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        return ds.partitioning(pa.schema([('deviceId', pa.string()), ('date', pa.string())]), flavor='hive')
+
+    def get_partition_dir(self, device, date):
+        return os.path.join('deviceId=' + str(device), 'date=' + str(date))
+
+    # Get the manifest ({'files': [paths relative to root], 'retired': [[path, time dropped]]}), re-read only when it changed
+    def read_manifest(self):
+        filename = os.path.join(self.root, self.manifest_name)
+        try:
+            stat = os.stat(filename)
+            stat = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            # A manifest replaced within the file system's timestamp granularity can look unchanged - re-read recent ones
+            if stat != self.manifest_stat or time.time_ns() - stat[0] < 2 * 10**9:
+                with open(filename, 'r') as file:
+                    self.manifest = json.load(file)
+                self.manifest_stat = stat
+        except FileNotFoundError:
+            self.manifest = {'files': [], 'retired': []}
+            self.manifest_stat = None
+
+        return self.manifest
+
+    # List the files of a store written before the manifest existed
+    def list_files(self):
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            files += [os.path.relpath(os.path.join(dirpath, f), self.root) for f in filenames
+                      if f.endswith('.' + self.file_format) and not f.startswith('_')]
+
+        return sorted(files)
+
+    # Swap added files in and removed files out of the manifest in one atomic rename, and delete the files retired long enough ago
+    def commit(self, added, removed=()):
+        with self.lock:
+            self.manifest_stat = None
+            manifest = self.read_manifest()
+            removed = set(removed)
+            now = time.time()
+            retired = manifest['retired'] + [[path, now] for path in removed]
+            manifest = {
+                'files': [path for path in manifest['files'] if path not in removed] + list(added),
+                'retired': [[path, dropped] for path, dropped in retired if now - dropped < self.retire_after],
+            }
+            os.makedirs(self.root, exist_ok=True)
+            temp_filename = os.path.join(self.root, '_' + uuid.uuid4().hex + '.json')
+            with open(temp_filename, 'w') as file:
+                json.dump(manifest, file)
+            os.replace(temp_filename, os.path.join(self.root, self.manifest_name))
+            for path, dropped in retired:
+                if now - dropped >= self.retire_after:
+                    self.remove_file(path)
+
+    def remove_file(self, path):
+        try:
+            os.remove(os.path.join(self.root, path))
+            os.removedirs(os.path.dirname(os.path.join(self.root, path)))  # drop the partition directories once empty
+        except OSError:
+            pass
+
+    # Replace the whole history - the new files are written next to the old ones and swapped in by one manifest update
+    def write(self, df):
+        self.commit(self.write_partitions(df), removed=self.read_manifest()['files'])
+
+    # Append new rows - every (device, day) in df gets one new file; partitions with too many small files are compacted
+    def append(self, df):
+        added = self.write_partitions(df)
+        self.commit(added)
+        for partition_dir in sorted(set(os.path.dirname(path) for path in added)):
+            if len(self.get_partition_files(partition_dir)) > self.max_files_per_partition:
+                self.compact(partition_dir)
+
+    # Write one new file per (device, day) of df, returning their paths (not yet in the manifest)
+    def write_partitions(self, df):
+        import pyarrow as pa
+
+        if df.empty:
+            return []
+        df = df[store_columns].copy()
+        # pandas keeps datetime64[ns] whatever unit is asked for, so truncate to ms here and let Arrow cast the column
+        df['timestamp'] = pd.to_datetime(df['timestamp']).dt.floor('ms')
+        df['value'] = df['value'].astype('float64')
+        for column in categorical_columns:
+            df[column] = df[column].astype(str)  # plain strings keep every file's schema the same
+        dates = df['timestamp'].dt.strftime('%Y-%m-%d')
+        schema = self.get_file_schema()
+        added = []
+        for (device, date), df_part in df.groupby([df['deviceId'], dates], sort=False):
+            partition_dir = self.get_partition_dir(device, date)
+            table = pa.Table.from_pandas(df_part[schema.names], schema=schema, preserve_index=False)
+            added.append(self.write_file(partition_dir, table))
+
+        return added
+
+    # Write one file under a temporary '_' name and rename it, returning its path relative to root
+    def write_file(self, partition_dir, table):
+        os.makedirs(os.path.join(self.root, partition_dir), exist_ok=True)
+        path = os.path.join(partition_dir, uuid.uuid4().hex + '.' + self.file_format)
+        temp_filename = os.path.join(self.root, partition_dir, '_' + os.path.basename(path))
+        self.write_table(table, temp_filename)
+        os.replace(temp_filename, os.path.join(self.root, path))
+
+        return path
+
+    def write_table(self, table, filename):
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, filename)
+
+    def read_table(self, filename, columns=None):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(filename, columns=columns)
+
+    def get_partition_files(self, partition_dir):
+        return [path for path in self.read_manifest()['files'] if os.path.dirname(path) == partition_dir]
+
+    # Merge all files of one partition into a single file, swapped in for the originals by one manifest update
+    def compact(self, partition_dir):
+        import pyarrow as pa
+
+        paths = self.get_partition_files(partition_dir)
+        table = pa.concat_tables([self.read_table(os.path.join(self.root, path)) for path in paths])
+        df = table.to_pandas().sort_values(by=['timestamp', 'data'], kind='mergesort')
+        self.commit([self.write_file(partition_dir, pa.Table.from_pandas(df, schema=table.schema, preserve_index=False))],
+                    removed=paths)
+
+    def get_filesystem(self):
+        import pyarrow.fs as fs
+
+        return fs.LocalFileSystem()
+
+    # A dataset of the manifest's files (only those of the requested devices)
+    def get_dataset(self, devices=None):
+        import pyarrow.dataset as ds
+
+        paths = self.read_manifest()['files']
+        if devices is not None:
+            partitions = set('deviceId=' + str(device) for device in devices)
+            paths = [path for path in paths if path.split(os.sep)[0] in partitions]
+        root = os.path.abspath(self.root)
+
+        return ds.dataset([os.path.join(root, path) for path in paths], schema=self.get_schema(), format=self.dataset_format,
+                          partitioning=self.get_partitioning(), partition_base_dir=root, filesystem=self.get_filesystem())
+
+    def get_filter(self, devices=None, start=None, end=None, channels=None):
+        import pyarrow.dataset as ds
+
+        expression = None
+        conditions = []
+        if devices is not None:
+            conditions.append(ds.field('deviceId').isin([str(device) for device in devices]))
+        if channels is not None:
+            conditions.append(ds.field('data').isin(list(channels)))
+        if start is not None:
+            start = pd.Timestamp(start)
+            conditions.append(ds.field('date') >= start.strftime('%Y-%m-%d'))
+            conditions.append(ds.field('timestamp') >= start.to_datetime64().astype('datetime64[ms]'))
+        if end is not None:
+            end = pd.Timestamp(end)
+            conditions.append(ds.field('date') <= end.strftime('%Y-%m-%d'))
+            conditions.append(ds.field('timestamp') <= end.to_datetime64().astype('datetime64[ms]'))
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        return expression
+
+    def read(self, devices=None, start=None, end=None, columns=None, channels=None):
+        import pyarrow as pa
+
+        columns = columns or store_columns
+        if not self.exists():
+            return pd.DataFrame(columns=columns)
+        for attempt in range(self.read_retries):
+            try:
+                table = self.get_dataset(devices).to_table(columns=columns, filter=self.get_filter(devices, start, end, channels))
+                break
+            except (FileNotFoundError, pa.ArrowInvalid):
+                # A file listed by the manifest was retired (or the manifest replaced) while reading - start over
+                self.manifest_stat = None
+                if attempt == self.read_retries - 1:
+                    raise
+        df = table.to_pandas()
+        if 'timestamp' in df.columns:
+            df['timestamp'] = df['timestamp'].astype('datetime64[ns]')
+            df = df.sort_values(by=[column for column in ('timestamp', 'deviceId', 'data') if column in df.columns],
+                                kind='mergesort', ignore_index=True)
+        for column in categorical_columns:
+            if column in df.columns:
+                df[column] = df[column].astype('category')
+
+        return df
+
+    # Get the unique (location, deviceId) pairs. deviceId comes from the manifest's partition paths and the location column is
+    # read once per file (files never change once written), so a call only reads the files added since the last one.
+    def read_devices(self):
+        known = self.file_locations
+        file_locations = {}
+        for path in self.read_manifest()['files']:
+            if path not in known:
+                table = self.read_table(os.path.join(self.root, path), columns=['location'])
+                known[path] = table.column('location').unique().to_pylist()
+            file_locations[path] = known[path]
+        self.file_locations = file_locations  # drop the files no longer in the manifest
+        pairs = set((location, path.split(os.sep)[0][len('deviceId='):])
+                    for path, locations in file_locations.items() for location in locations)
+
+        return pd.DataFrame(sorted(pairs), columns=['location', 'deviceId'])
+
+
+
+#Arrow===========================================================================================================================#
+# The same partitioned layout as ParquetStore, but stored as uncompressed Arrow IPC (Feather v2) files that are read through
+# memory maps. The column buffers are used in place from the OS page cache, so every gunicorn worker shares one copy of the
+# history and only the filtered slice handed to pandas is materialized per process.
+class ArrowStore(ParquetStore):
+    file_format = 'arrow'
+    dataset_format = 'ipc'
+
+    def write_table(self, table, filename):
+        import pyarrow as pa
+
+        with pa.OSFile(filename, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def read_table(self, filename, columns=None):
+        import pyarrow as pa
+
+        with pa.memory_map(filename, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = pa.Table.from_arrays([table.column(column) for column in columns], names=columns)
+
+        return table
+
+    def get_filesystem(self):
+        import pyarrow.fs as fs
+
+        return fs.LocalFileSystem(use_mmap=True)
+
+
+
+#SQLite==========================================================================================================================#
+# One SQLite table in WAL mode with composite (deviceId, data, timestamp) and (deviceId, timestamp) indexes. Per-device
+# reads, with or without a channel filter, are index range scans, so they stay flat as the fleet grows, and WAL lets the
+# dashboard read while aws_app writes without retries. Timestamps are stored as integer milliseconds.
+class SqliteStore:
+
+    def __init__(self, filename, legacy_csv_filename=None):
+        self.filename = filename
+        self.local = threading.local()  # sqlite3 connections cannot be shared between threads
+        is_new = not os.path.exists(filename)
+        with self.get_connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS sensor_data '
+                               '(location TEXT, deviceId TEXT, timestamp INTEGER, data TEXT, value REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS sensor_data_device_channel_time '
+                               'ON sensor_data (deviceId, data, timestamp)')
+            connection.execute('CREATE INDEX IF NOT EXISTS sensor_data_device_time '
+                               'ON sensor_data (deviceId, timestamp)')
+        if is_new and legacy_csv_filename and os.path.exists(legacy_csv_filename):
+            self.append(CsvStore(legacy_csv_filename).read())
+
+    def get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+
+        return connection
+
+    def exists(self):
+        return self.get_connection().execute('SELECT 1 FROM sensor_data LIMIT 1').fetchone() is not None
+
+    # Replace the whole history
+    def write(self, df):
+        with self.get_connection() as connection:
+            connection.execute('DELETE FROM sensor_data')
+            self.insert(connection, df)
+
+    # Append new rows
+    def append(self, df):
+        with self.get_connection() as connection:
+            self.insert(connection, df)
+
+    def insert(self, connection, df):
+        if df.empty:
+            return
+        df = df[store_columns].copy()
+        df['timestamp'] = pd.to_datetime(df['timestamp']).values.astype('datetime64[ms]').astype('int64')
+        df['value'] = df['value'].astype('float64')
+        connection.executemany('INSERT INTO sensor_data VALUES (?, ?, ?, ?, ?)', df.itertuples(index=False, name=None))
+
+    def read(self, devices=None, start=None, end=None, columns=None, channels=None):
+        columns = columns or store_columns
+        conditions = []
+        params = []
+        if devices is not None:
+            devices = [str(device) for device in devices]
+            conditions.append('deviceId IN (%s)' % ', '.join('?' * len(devices)))
+            params += devices
+        if channels is not None:
+            channels = list(channels)
+            conditions.append('data IN (%s)' % ', '.join('?' * len(channels)))
+            params += channels
+        if start is not None:
+            conditions.append('timestamp >= ?')
+            params.append(int(pd.Timestamp(start).to_datetime64().astype('datetime64[ms]').astype('int64')))
+        if end is not None:
+            conditions.append('timestamp <= ?')
+            params.append(int(pd.Timestamp(end).to_datetime64().astype('datetime64[ms]').astype('int64')))
+        query = 'SELECT %s FROM sensor_data' % ', '.join(columns)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        if 'timestamp' in columns:
+            query += ' ORDER BY ' + ', '.join(column for column in ('timestamp', 'deviceId', 'data') if column in columns)
+
+        df = pd.read_sql_query(query, self.get_connection(), params=params)
+        if 'timestamp' in df.columns:
+            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms').astype('datetime64[ns]')
+        for column in categorical_columns:
+            if column in df.columns:
+                df[column] = df[column].astype('category')
+
+        return df
+
+    # Get the unique (location, deviceId) pairs
+    def read_devices(self):
+        return pd.read_sql_query('SELECT DISTINCT location, deviceId FROM sensor_data', self.get_connection())
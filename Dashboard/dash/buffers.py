@@ -0,0 +1,93 @@
+#Imports=========================================================================================================================#
+import threading
+import numpy as np
+import pandas as pd
+import rollups
+import utils
+
+
+
+#Buffers=========================================================================================================================#
+# Append-only time series of one (device, channel): preallocated NumPy arrays that double in size when full, so appending
+# n points is amortised O(n) and reading is a view rather than a copy. Appends only write past the size readers have seen,
+# and the arrays and size are swapped under the lock, so a view taken while appending is still consistent.
+class SeriesBuffer:
+
+    def __init__(self, capacity=1024):
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamps, values):
+        with self.lock:
+            size = self.size + len(timestamps)
+            if size > len(self.timestamps):
+                capacity = len(self.timestamps)
+                while capacity < size:
+                    capacity *= 2
+                # Readers may still hold views of the old arrays - copy into new ones instead of resizing in place
+                self.timestamps = np.concatenate([self.timestamps[:self.size], np.empty(capacity - self.size, dtype=np.int64)])
+                self.values = np.concatenate([self.values[:self.size], np.empty(capacity - self.size, dtype=np.float64)])
+            self.timestamps[self.size:size] = timestamps
+            self.values[self.size:size] = values
+            self.size = size
+
+    # Read-only views of the timestamps (int64 ms) and raw values, both of the same length
+    def view(self):
+        with self.lock:
+            timestamps, values, size = self.timestamps, self.values, self.size
+        timestamps = timestamps[:size]
+        values = values[:size]
+        timestamps.flags.writeable = False
+        values.flags.writeable = False
+
+        return timestamps, values
+
+
+
+#Functions=======================================================================================================================#
+# Process-wide buffers, shared by every callback and session. Refreshes of one device are serialized by that device's lock;
+# different devices refresh in parallel.
+buffers = {}  # (device, channel) -> SeriesBuffer
+loaded_until = {}  # device -> highest timestamp (int64 ms) already in the buffers
+device_locks = {}  # device -> lock held while refreshing it
+buffers_lock = threading.Lock()
+
+def get_device_lock(device):
+    with buffers_lock:
+        return device_locks.setdefault(device, threading.Lock())
+
+# Load the rows stored since the last refresh of this device - only the new rows are read and appended
+def refresh(device):
+    with get_device_lock(device):
+        last = loaded_until.get(device)
+        start = None if last is None else pd.Timestamp(last + 1, unit='ms')
+        df_wide = utils.get_wide_df(devices=[device], start=start)
+        if last is not None:
+            df_wide = df_wide[df_wide['timestamp'] > last]
+        if df_wide.empty:
+            return
+        timestamps = df_wide['timestamp'].to_numpy()
+        for channel in df_wide.columns.drop(['deviceId', 'timestamp']):
+            values = df_wide[channel].to_numpy(dtype=np.float64)
+            present = ~np.isnan(values)
+            if (device, channel) not in buffers:
+                buffers[(device, channel)] = SeriesBuffer()
+            buffers[(device, channel)].append(timestamps[present], values[present])
+            rollups.update(device, channel, timestamps[present], values[present])
+        loaded_until[device] = int(timestamps.max())
+
+# Get the timestamps (int64 ms) and raw values of one channel as of the last refresh
+def get_series(device, channel):
+    buffer = buffers.get((device, channel))
+    if buffer is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    return buffer.view()
+
+# Drop all buffers (e.g. after the store was rewritten) - call rollups.reset() and scaling.reset() as well
+def reset():
+    with buffers_lock:
+        buffers.clear()
+        loaded_until.clear()
@@ -0,0 +1,173 @@
+#Imports=========================================================================================================================#
+import os
+import pickle
+import sqlite3
+import threading
+
+
+
+#Variables=======================================================================================================================#
+backend = 'sqlite'  # 'pickle' (one process) or 'sqlite' (shared by all gunicorn workers)
+pickle_filename = 'temp/dcc_store_data.pkl'
+sqlite_filename = 'temp/config.db'
+
+# Get the configured config store
+def get_config_store(name=None):
+    name = name or backend
+    if name == 'pickle':
+        return ConfigStore(pickle_filename)
+    if name == 'sqlite':
+        return SqliteConfigStore(sqlite_filename, legacy_pickle_filename=pickle_filename)
+    raise ValueError('Unknown config store: %s' % name)
+
+
+
+#Pickle==========================================================================================================================#
+# The location/device/channel hierarchy (the store data: [{location: {'alias', 'children': {device: {'alias', 'children':
+# {channel: {...}}}}}}]) held in memory behind a lock. Reads never touch the disk; every update bumps a version counter and
+# is persisted atomically (written to a temp file, then renamed over the old one), so a crash or a concurrent reader never
+# sees a half-written file. Only safe with a single process.
+class ConfigStore:
+
+    def __init__(self, filename='temp/dcc_store_data.pkl'):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.data = None
+        self.data_bytes = None
+        self.version = 0
+        self.load()
+
+    # Load the persisted hierarchy (files written before the version counter existed hold the bare data list)
+    def load(self):
+        try:
+            with open(self.filename, 'rb') as file:
+                stored = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return
+        if isinstance(stored, dict):
+            data, version = stored['data'], stored['version']
+        else:
+            data, version = stored, 0
+        with self.lock:
+            self.data = data
+            self.data_bytes = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+            self.version = version
+
+    # The current hierarchy, shared by every caller - treat it as read-only
+    def get(self):
+        return self.data
+
+    # A private copy of the current hierarchy that the caller may modify and pass to update()
+    def copy(self):
+        return pickle.loads(self.data_bytes)
+
+    def get_version(self):
+        return self.version
+
+    # Replace the hierarchy and persist it, returning the new version
+    def update(self, data):
+        data_bytes = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            version = self.version + 1
+            self.write({'version': version, 'data': data})
+            self.data = pickle.loads(data_bytes)
+            self.data_bytes = data_bytes
+            self.version = version
+
+        return version
+
+    def write(self, stored):
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'wb') as file:
+            pickle.dump(stored, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filename, self.filename)
+
+
+
+#SQLite==========================================================================================================================#
+# The same interface backed by one SQLite table of pickled values, each with its own version. Every worker keeps the values
+# it has read in a local cache and polls PRAGMA data_version (which changes only when another connection commits, and costs
+# no disk read) before serving one; only when it changed are the versions re-read and the stale values reloaded. The
+# hierarchy is the 'store_data' value.
+class SqliteConfigStore:
+
+    data_key = 'store_data'
+
+    def __init__(self, filename, legacy_pickle_filename=None):
+        self.filename = filename
+        self.local = threading.local()  # sqlite3 connections cannot be shared between threads
+        self.lock = threading.Lock()
+        self.cache = {}  # key -> (version, value, pickled value)
+        with self.get_connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, version INTEGER, value BLOB)')
+        if legacy_pickle_filename and self.get_entry(self.data_key) is None:
+            legacy = ConfigStore(legacy_pickle_filename)
+            if legacy.get() is not None:
+                self.update(legacy.get())
+
+    def get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.data_version = None
+
+        return connection
+
+    # Drop the cached values other workers have changed since this thread last looked
+    def poll(self):
+        connection = self.get_connection()
+        data_version = connection.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self.local.data_version:
+            return
+        self.local.data_version = data_version
+        versions = dict(connection.execute('SELECT key, version FROM config').fetchall())
+        with self.lock:
+            for key in [key for key, entry in self.cache.items() if versions.get(key) != entry[0]]:
+                del self.cache[key]
+
+    def get_entry(self, key):
+        self.poll()
+        entry = self.cache.get(key)
+        if entry is None:
+            row = self.get_connection().execute('SELECT version, value FROM config WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            entry = (row[0], pickle.loads(row[1]), bytes(row[1]))
+            with self.lock:
+                self.cache[key] = entry
+
+        return entry
+
+    def set_entry(self, key, value):
+        value_bytes = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.get_connection() as connection:
+            connection.execute('INSERT INTO config VALUES (?, 1, ?) '
+                               'ON CONFLICT (key) DO UPDATE SET version = version + 1, value = excluded.value',
+                               (key, value_bytes))
+            version = connection.execute('SELECT version FROM config WHERE key = ?', (key,)).fetchone()[0]
+        with self.lock:
+            self.cache[key] = (version, pickle.loads(value_bytes), value_bytes)
+
+        return version
+
+    # The current hierarchy, shared by every caller of this worker - treat it as read-only
+    def get(self):
+        entry = self.get_entry(self.data_key)
+
+        return entry[1] if entry else None
+
+    # A private copy of the current hierarchy that the caller may modify and pass to update()
+    def copy(self):
+        return pickle.loads(self.get_entry(self.data_key)[2])
+
+    def get_version(self):
+        entry = self.get_entry(self.data_key)
+
+        return entry[0] if entry else 0
+
+    # Replace the hierarchy, returning the new version
+    def update(self, data):
+        return self.set_entry(self.data_key, data)
@@ -0,0 +1,96 @@
+#Imports=========================================================================================================================#
+import threading
+import numpy as np
+
+
+
+#Algorithms======================================================================================================================#
+# Both algorithms take time-sorted x (int64 ms) and y (float) arrays and return the sorted indices of the points to plot,
+# always including the first and last point.
+
+# Min-max per pixel: split the time range into n_buckets equal buckets and keep the lowest and highest point of each, so every
+# spike stays visible and the line drawn looks the same as with all points
+def minmax(x, y, n_buckets):
+    n = len(x)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+
+    span = int(x[-1] - x[0]) + 1
+    buckets = (x - x[0]) * n_buckets // span
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    extremes = [0, n - 1]
+    for reduce in (np.minimum, np.maximum):
+        # First point of each bucket equal to the bucket's extreme
+        candidates = np.flatnonzero(y == np.repeat(reduce.reduceat(y, starts), counts))
+        extremes.append(candidates[np.r_[True, buckets[candidates[1:]] != buckets[candidates[:-1]]]])
+
+    return np.unique(np.concatenate([np.atleast_1d(extreme) for extreme in extremes]))
+
+# Largest-Triangle-Three-Buckets: keep the point of each bucket that forms the largest triangle with the point kept in the
+# previous bucket and the mean of the next one. Smoother than min-max for the same point count; the global minimum and
+# maximum are added back so no extreme is lost.
+def lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = (x - x[0]).astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    next_x = np.r_[(np.add.reduceat(x[:n - 1], edges[:-1]) / counts)[1:], x[-1]]
+    next_y = np.r_[(np.add.reduceat(y[:n - 1], edges[:-1]) / counts)[1:], y[-1]]
+
+    index = np.empty(n_out, dtype=np.int64)
+    index[0] = a = 0
+    index[-1] = n - 1
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        index[i + 1] = a
+
+    return np.unique(np.r_[index, np.argmin(y), np.argmax(y)])
+
+
+
+#Functions=======================================================================================================================#
+method = 'minmax'  # or 'lttb'
+graph_width = 1280  # fallback plot width in pixels until the browser has reported the real one (the 'graph_width' store)
+preaggregate_factor = 8  # LTTB inputs longer than this many points per output point are min-max reduced first
+
+# Get the indices of the points to plot for a graph width_px pixels wide (about two points per pixel)
+def get_index(x, y, width_px=None, method=None):
+    width_px = width_px or graph_width
+    method = method or globals()['method']
+    if method == 'lttb':
+        n_out = 2 * width_px
+        if len(x) > preaggregate_factor * n_out:
+            # A min-max level at a few points per pixel keeps the extremes and bounds the LTTB loop's per-bucket work
+            level = minmax(x, y, preaggregate_factor * n_out // 2)
+            return level[lttb(x[level], y[level], n_out)]
+        return lttb(x, y, n_out)
+
+    return minmax(x, y, width_px)
+
+# The last index computed per series and graph width, reused while the series' version stays the same. By default the version
+# is the length, which identifies an append-only series; series whose last point can still change pass a version that covers
+# it. The selected points do not depend on the channel's scaling, which is affine, so raw or scaled values can be passed for
+# the same key.
+indices = {}  # (key, width_px, method) -> (version, index)
+indices_lock = threading.Lock()
+
+def get_index_cached(key, x, y, width_px=None, method=None, version=None):
+    width_px = width_px or graph_width
+    method = method or globals()['method']
+    version = len(x) if version is None else version
+    with indices_lock:
+        entry = indices.get((key, width_px, method))
+    if entry and entry[0] == version:
+        return entry[1]
+
+    index = get_index(x, y, width_px, method)
+    with indices_lock:
+        indices[(key, width_px, method)] = (version, index)
+
+    return index
@@ -13,6 +13,10 @@ import dash
 import pandas as pd
 import numpy as np
 from app import app
+import buffers
+import downsample
+import rollups
+import scaling
 import utils
 
 
@@ -37,9 +41,8 @@ map = dbc.Card(dcc.Graph(id='graph_map', animate=True, figure=fig_map), color='p
 
 
 #Data============================================================================================================================#
-df = utils.get_df('../data/sensor_data.csv')
 data = utils.get_store_data()
-tree_nodes = utils.update_tree_nodes(data)
+tree_version, tree_nodes = utils.get_tree_nodes()
 
 
 
@@ -365,6 +368,9 @@ layout = html.Div([
                     dcc.Store(id='nav_tree_trigger_add', storage_type='local', data=True),
                     dcc.Store(id='nav_tree_trigger_disable', storage_type='local', data=True),
                     dcc.Store(id='nav_tree_trigger_alias', storage_type='local', data=True),
+                    dcc.Store(id='view_state', storage_type='session'),
+                    dcc.Store(id='nav_tree_version', data=tree_version),
+                    dcc.Store(id='graph_width'),
                     dcc.Interval(id='graph_update', interval=1*1000, n_intervals=0),
                     dbc.Col(
                         dbc.Card(COMP_nav_tree, color='primary', style={'height': '100%'}),
@@ -399,15 +405,16 @@ app.layout = html.Div(
 #Views===========================================================================================================================#
 # Switch between views
 @app.callback([Output('nav_tree', 'checked'),
-               Output('col', 'children')],
-              Input('nav_tree', 'checked'))
-def switch_views(checked):
+               Output('col', 'children'),
+               Output('view_state', 'data')],
+              Input('nav_tree', 'checked'),
+              State('view_state', 'data'))
+def switch_views(checked, view_state):
 
     if checked is None:
         checked = []
 
-    with open('temp/tree.txt', 'r') as file:
-        checked_global = [current_place.rstrip() for current_place in file.readlines()]
+    checked_global = list(view_state['checked']) if view_state else []
 
     checked_diff = list(set(checked).difference(checked_global))
 
@@ -422,31 +429,33 @@ def switch_views(checked):
     else:
         checked_global = checked_diff
 
-    with open('temp/tree.txt', 'w') as file:
-        file.writelines('%s\n' % item for item in checked_global)
+    view_state = utils.set_view_state(view_state, checked_global)
 
     if checked_global:
         if checked_global[0].find('ch') > -1:
-            return checked_global, DIV_channels
+            return checked_global, DIV_channels, view_state
 
         if checked_global[0].find('dev') > -1:
-            return checked_global, DIV_devices
+            return checked_global, DIV_devices, view_state
 
         if checked_global[0].find('loc') > -1:
-            return checked_global, DIV_locations
+            return checked_global, DIV_locations, view_state
 
-    return checked_global, DIV_home
+    return checked_global, DIV_home, view_state
 
-# Update nav_tree
-@app.callback(Output('nav_tree', 'nodes'),
+# Update nav_tree (only sent when the store data changed since the version this page holds)
+@app.callback([Output('nav_tree', 'nodes'),
+               Output('nav_tree_version', 'data')],
               [Input('nav_tree_trigger_alias', 'data'),
                Input('nav_tree_trigger_disable', 'data'),
-               Input('nav_tree_trigger_add', 'data')])
-def update_nav_tree(nav_tree_trigger_alias, nav_tree_trigger_disable, nav_tree_trigger_add):
-    data = utils.get_store_data()
-    nodes = utils.update_tree_nodes(data)
+               Input('nav_tree_trigger_add', 'data')],
+              State('nav_tree_version', 'data'))
+def update_nav_tree(nav_tree_trigger_alias, nav_tree_trigger_disable, nav_tree_trigger_add, nav_tree_version):
+    version, nodes = utils.get_tree_nodes()
+    if version == nav_tree_version:
+        return dash.no_update, dash.no_update
 
-    return nodes
+    return nodes, version
 
 
 
@@ -470,20 +479,20 @@ def add_locations_and_devices(n, nav_tree_trigger_add):
 #Devices=========================================================================================================================#
 # Update h4_device_id children
 @app.callback(Output('h4_device_id', 'children'),
-              Input('nav_tree', 'checked'))
-def update_h4_device_id_children(checked):
+              Input('view_state', 'data'))
+def update_h4_device_id_children(view_state):
 
-    page_dict = utils.get_current_page_dict()
+    page_dict = utils.get_page_dict(view_state)
     device = page_dict['dev']
 
     return device
 
 # Update in_a_dev placeholders
 @app.callback(Output('in_a_dev', 'placeholder'),
-              Input('nav_tree', 'checked'))
-def update_in_a_dev_placeholders(checked):
+              Input('view_state', 'data'))
+def update_in_a_dev_placeholders(view_state):
 
-    page_dict = utils.get_current_page_dict()
+    page_dict = utils.get_page_dict(view_state)
     location = page_dict['loc']
     device = page_dict['dev']
     data = utils.get_store_data()
@@ -499,22 +508,22 @@ def update_in_a_dev_placeholders(checked):
                Input('in_a_ch4', 'value'),
                Input('in_a_ch5', 'value'),
                Input('in_a_dev', 'value')],
-              State('nav_tree_trigger_alias', 'data'),
+              [State('nav_tree_trigger_alias', 'data'),
+               State('view_state', 'data')],
               prevent_initial_call=True)
-def get_in_a_ch_values(a1, a2, a3, a4, a5, a_dev, nav_tree_trigger_alias):
+def get_in_a_ch_values(a1, a2, a3, a4, a5, a_dev, nav_tree_trigger_alias, view_state):
 
     arguments = locals()
-    page_dict = utils.get_current_page_dict()
+    page_dict = utils.get_page_dict(view_state)
     location = page_dict['loc']
     device = page_dict['dev']
     data = utils.get_store_data()
-    for i in range(1, len(arguments)-1):
+    for i in range(1, 6):
         if arguments['a'+str(i)]:
             channel = 'ch'+str(i)
             data[0][location]['children'][device]['children'][channel]['alias'] = arguments['a'+str(i)]
     if arguments['a_dev']: data[0][location]['children'][device]['alias'] = arguments['a_dev']
     utils.update_store_data(data)
-    nodes = utils.update_tree_nodes(data)
 
     if nav_tree_trigger_alias:
         return False
@@ -524,11 +533,11 @@ def get_in_a_ch_values(a1, a2, a3, a4, a5, a_dev, nav_tree_trigger_alias):
 # Update in_a_ch
 for input_box in ('in_a_ch1', 'in_a_ch2', 'in_a_ch3', 'in_a_ch4', 'in_a_ch5'):
     @app.callback(Output(input_box, 'placeholder'),
-                  Input('nav_tree', 'checked'),
+                  Input('view_state', 'data'),
                   State(input_box, 'id'))
-    def update_in_a_ch_placeholders(checked, id):
+    def update_in_a_ch_placeholders(view_state, id):
 
-        page_dict = utils.get_current_page_dict()
+        page_dict = utils.get_page_dict(view_state)
         location = page_dict['loc']
         device = page_dict['dev']
         channel = id.split('_')[-1]
@@ -541,11 +550,12 @@ for input_box in ('in_a_ch1', 'in_a_ch2', 'in_a_ch3', 'in_a_ch4', 'in_a_ch5'):
 for input_box in ('in_sf_ch1', 'in_sf_ch2', 'in_sf_ch3', 'in_sf_ch4', 'in_sf_ch5'):
     @app.callback(Output(input_box, 'type'),
                   Input(input_box, 'value'),
-                  State(input_box, 'id'),
+                  [State(input_box, 'id'),
+                   State('view_state', 'data')],
                   prevent_initial_call=True)
-    def get_in_sf_ch_values(value, id):
+    def get_in_sf_ch_values(value, id, view_state):
 
-        page_dict = utils.get_current_page_dict()
+        page_dict = utils.get_page_dict(view_state)
         location = page_dict['loc']
         device = page_dict['dev']
         channel = id.split('_')[-1]
@@ -556,11 +566,11 @@ for input_box in ('in_sf_ch1', 'in_sf_ch2', 'in_sf_ch3', 'in_sf_ch4', 'in_sf_ch5
         return 'number'
 
     @app.callback(Output(input_box, 'placeholder'),
-                  Input('nav_tree', 'checked'),
+                  Input('view_state', 'data'),
                   State(input_box, 'id'))
-    def update_in_sf_ch_placeholders(checked, id):
+    def update_in_sf_ch_placeholders(view_state, id):
 
-        page_dict = utils.get_current_page_dict()
+        page_dict = utils.get_page_dict(view_state)
         location = page_dict['loc']
         device = page_dict['dev']
         channel = id.split('_')[-1]
@@ -573,11 +583,12 @@ for input_box in ('in_sf_ch1', 'in_sf_ch2', 'in_sf_ch3', 'in_sf_ch4', 'in_sf_ch5
 for input_box in ('in_u_ch1', 'in_u_ch2', 'in_u_ch3', 'in_u_ch4', 'in_u_ch5'):
     @app.callback(Output(input_box, 'type'),
                   Input(input_box, 'value'),
-                  State(input_box, 'id'),
+                  [State(input_box, 'id'),
+                   State('view_state', 'data')],
                   prevent_initial_call=True)
-    def get_in_u_ch_values(value, id):
+    def get_in_u_ch_values(value, id, view_state):
 
-        page_dict = utils.get_current_page_dict()
+        page_dict = utils.get_page_dict(view_state)
         location = page_dict['loc']
         device = page_dict['dev']
         channel = id.split('_')[-1]
@@ -588,11 +599,11 @@ for input_box in ('in_u_ch1', 'in_u_ch2', 'in_u_ch3', 'in_u_ch4', 'in_u_ch5'):
         return 'text'
 
     @app.callback(Output(input_box, 'placeholder'),
-                  Input('nav_tree', 'checked'),
+                  Input('view_state', 'data'),
                   State(input_box, 'id'))
-    def update_in_u_ch_placeholders(checked, id):
+    def update_in_u_ch_placeholders(view_state, id):
 
-        page_dict = utils.get_current_page_dict()
+        page_dict = utils.get_page_dict(view_state)
         location = page_dict['loc']
         device = page_dict['dev']
         channel = id.split('_')[-1]
@@ -628,12 +639,13 @@ for input_box in ('in_u_ch1', 'in_u_ch2', 'in_u_ch3', 'in_u_ch4', 'in_u_ch5'):
                Input('btn_disable3', 'n_clicks'),
                Input('btn_disable4', 'n_clicks'),
                Input('btn_disable5', 'n_clicks')],
-              State('nav_tree_trigger_disable', 'data'), prevent_initial_call=True)
-def get_btn_disable(n1, n2, n3, n4, n5, nav_tree_trigger_disable):
+              [State('nav_tree_trigger_disable', 'data'),
+               State('view_state', 'data')], prevent_initial_call=True)
+def get_btn_disable(n1, n2, n3, n4, n5, nav_tree_trigger_disable, view_state):
 
     out = []
 
-    page_dict = utils.get_current_page_dict()
+    page_dict = utils.get_page_dict(view_state)
     location = page_dict['loc']
     device = page_dict['dev']
 
@@ -698,6 +710,22 @@ def get_btn_pause(n, current):
     else:
         return [1*1000, 'Pause']
 
+# Get graph_width - the width in pixels of the visible channel graphs, measured in the browser. Only sent when it changed.
+app.clientside_callback(
+    '''
+    function(n, width) {
+        var widths = [1, 2, 3, 4, 5].map(function(i) {
+            var graph = document.getElementById('COMP_graph_ch' + i);
+            return graph ? Math.round(graph.getBoundingClientRect().width) : 0;
+        });
+        var current = Math.max.apply(null, widths);
+        return (current && current !== width) ? current : window.dash_clientside.no_update;
+    }
+    ''',
+    Output('graph_width', 'data'),
+    Input('graph_update', 'n_intervals'),
+    State('graph_width', 'data'))
+
 # Update COMP_graph_ch
 @app.callback([Output('COMP_graph_ch1', 'figure'),
                Output('COMP_graph_ch2', 'figure'),
@@ -705,48 +733,46 @@ def get_btn_pause(n, current):
                Output('COMP_graph_ch4', 'figure'),
                Output('COMP_graph_ch5', 'figure')],
               [Input('graph_update', 'n_intervals'),
-               Input('nav_tree', 'checked')])
-def update_graphs(n, checked):
+               Input('view_state', 'data')],
+              State('graph_width', 'data'))
+def update_graphs(n, view_state, graph_width):
 
-    page_dict = utils.get_current_page_dict()
+    page_dict = utils.get_page_dict(view_state)
     location = page_dict['loc']
     device = page_dict['dev']
 
     channels_ld = utils.get_channels(location, device)
-
-    scaling_fact = 1.0
-
-    flag = False
-    while not flag:
-        try:
-            df_scaled = pd.read_csv('../data/sensor_data.csv')
-            flag = True
-        except pd.errors.EmptyDataError:
-            pass
-
-    df_scaled['value'] = df_scaled['value'].astype(float)
-    for channel_dict in channels_ld:
-        channel = channel_dict['name']
-        scaling_fact = float(channel_dict['scaling_fact'])
-        if not scaling_fact: scaling_fact = 1
-        df_scaled.loc[df_scaled['data']==channel, 'value'] = df_scaled[df_scaled['data']==channel]['value'] * scaling_fact
-    df_scaled.index = pd.to_datetime(df_scaled['timestamp'])
+    buffers.refresh(device)
+    plot_width = max(graph_width - 70, 100) if graph_width else None  # minus the figure's left and right margins
 
     figures = []
     i = 0
     for channel in channels_ld:
 
         trace = []
-
-        if checked and (len(df_scaled.loc[df_scaled['deviceId'] == device]) > 5):
-            df_data = df_scaled[df_scaled['data'] == channel['name']]
-            df_data_id = df_data[df_data['deviceId'] == device]
-            xmin = df_data_id.index.min()
-            xmax = df_data_id.index.max()
-            ymin = df_data_id['value'].min() - 0.05 * np.abs(df_data_id['value'].max())
-            ymax = df_data_id['value'].max() + 0.05 * np.abs(df_data_id['value'].max())
-            trace.append(go.Scatter(x=df_data_id.index,
-                                    y=df_data_id['value'],
+        timestamps, y = scaling.get_series(device, channel)
+        resolution = None
+        version = None
+        table = rollups.get_table(device, channel['name'], len(timestamps), plot_width or downsample.graph_width)
+        if table:
+            # Long ranges are drawn from the coarsest rollup that still fills the graph. Its last bucket is still open, so
+            # its min and max are part of the version the cached index is checked against.
+            resolution = table.resolution
+            timestamps, y = rollups.get_minmax_series(table)
+            scale, offset = scaling.get_transform(channel)
+            y = y * scale + offset
+            version = (len(timestamps), y[-2], y[-1])
+        index = downsample.get_index_cached((device, channel['name'], resolution), timestamps, y, plot_width, version=version)
+        x = utils.get_datetimes(timestamps[index])
+        y = y[index]
+
+        if utils.get_checked(view_state) and (len(x) > 1):
+            xmin = x.min()
+            xmax = x.max()
+            ymin = np.nanmin(y) - 0.05 * np.abs(np.nanmax(y))
+            ymax = np.nanmax(y) + 0.05 * np.abs(np.nanmax(y))
+            trace.append(go.Scatter(x=x,
+                                    y=y,
                                     mode='lines+markers',
                                     line={'width': 3},
                                     opacity=0.7,
@@ -756,14 +782,12 @@ def update_graphs(n, checked):
                         )
             )
         else:
-            df_clear = df_scaled
-            df_clear['value'].values[:] = 0
-            xmin = df_scaled.index.min()
-            xmax = df_scaled.index.max()
+            xmin = x.min()
+            xmax = x.max()
             ymin = -100
             ymax = 100
-            trace.append(go.Scatter(x=df_clear.index,
-                                    y=df_clear['value'],
+            trace.append(go.Scatter(x=x,
+                                    y=np.zeros(len(x)),
                                     mode='lines',
                                     line={'width': 3},
                                     opacity=0.7,
@@ -803,17 +827,18 @@ def update_graphs(n, checked):
                Output('ROW_graph_ch3', 'style'),
                Output('ROW_graph_ch4', 'style'),
                Output('ROW_graph_ch5', 'style')],
-              Input('nav_tree', 'checked'))
-def display_graphs(checked):
+              Input('view_state', 'data'))
+def display_graphs(view_state):
 
     channels = []
 
-    page_dict = utils.get_current_page_dict()
+    page_dict = utils.get_page_dict(view_state)
     location = page_dict['loc']
     device = page_dict['dev']
     channels_ld = utils.get_channels(location, device)
 
     graphs_to_display = []
+    checked = utils.get_checked(view_state)
 
     if checked:
         for item in checked:
@@ -0,0 +1,105 @@
+#Imports=========================================================================================================================#
+import threading
+import numpy as np
+
+
+
+#Rollups=========================================================================================================================#
+# Aggregates of one (device, channel) at one resolution: one row per non-empty bucket with the bucket start (int64 ms, same
+# clock as the buffers) and the min, max, sum, count and last raw value of the bucket. Rows are appended as new points
+# arrive; only the last bucket can still change, so it is merged with the first bucket of the next update.
+class RollupTable:
+
+    fields = {'timestamp': np.int64, 'min': np.float64, 'max': np.float64, 'sum': np.float64, 'count': np.int64,
+              'last': np.float64}
+
+    def __init__(self, resolution, capacity=256):
+        self.resolution = resolution
+        self.columns = {field: np.empty(capacity, dtype=dtype) for field, dtype in self.fields.items()}
+        self.size = 0
+
+    # Fold time-sorted points, all newer than the points already folded in, into the table
+    def update(self, timestamps, values):
+        if not len(timestamps):
+            return
+        buckets = timestamps // self.resolution * self.resolution
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+        rows = {
+            'timestamp': buckets[starts],
+            'min': np.minimum.reduceat(values, starts),
+            'max': np.maximum.reduceat(values, starts),
+            'sum': np.add.reduceat(values, starts),
+            'count': np.diff(np.r_[starts, len(buckets)]),
+            'last': values[ends],
+        }
+
+        if self.size and self.columns['timestamp'][self.size - 1] == rows['timestamp'][0]:
+            i = self.size - 1
+            columns = self.columns
+            columns['min'][i] = min(columns['min'][i], rows['min'][0])
+            columns['max'][i] = max(columns['max'][i], rows['max'][0])
+            columns['sum'][i] += rows['sum'][0]
+            columns['count'][i] += rows['count'][0]
+            columns['last'][i] = rows['last'][0]
+            rows = {field: column[1:] for field, column in rows.items()}
+
+        size = self.size + len(rows['timestamp'])
+        if size > len(self.columns['timestamp']):
+            capacity = len(self.columns['timestamp'])
+            while capacity < size:
+                capacity *= 2
+            # Copy into new arrays so views handed out earlier stay valid
+            self.columns = {field: np.concatenate([column[:self.size], np.empty(capacity - self.size, dtype=column.dtype)])
+                            for field, column in self.columns.items()}
+        for field, column in rows.items():
+            self.columns[field][self.size:size] = column
+        self.size = size
+
+    # Read-only views of the columns, plus the bucket means
+    def view(self):
+        view = {field: column[:self.size] for field, column in self.columns.items()}
+        for column in view.values():
+            column.flags.writeable = False
+        view['mean'] = view['sum'] / view['count']
+
+        return view
+
+
+
+#Functions=======================================================================================================================#
+resolutions = [60 * 1000, 60 * 60 * 1000, 24 * 60 * 60 * 1000]  # 1 min, 1 h, 1 day
+tables = {}  # (device, channel) -> [RollupTable per resolution]
+tables_lock = threading.Lock()
+
+# Fold new points of one channel into every resolution (called by buffers.refresh with the rows it appends)
+def update(device, channel, timestamps, values):
+    with tables_lock:
+        if (device, channel) not in tables:
+            tables[(device, channel)] = [RollupTable(resolution) for resolution in resolutions]
+        for table in tables[(device, channel)]:
+            table.update(timestamps, values)
+
+# Get the coarsest table that still has min_points buckets and is smaller than the raw series (None: plot the raw points)
+def get_table(device, channel, raw_points, min_points):
+    with tables_lock:
+        for table in reversed(tables.get((device, channel), [])):
+            if min_points <= table.size < raw_points:
+                return table
+
+    return None
+
+# Get the timestamps and values of a table as a min-max series: each bucket's min and max at the bucket start, in time order.
+# The last bucket is still updated in place, so the copy is taken under the lock.
+def get_minmax_series(table):
+    with tables_lock:
+        view = table.view()
+        timestamps = np.repeat(view['timestamp'], 2)
+        values = np.column_stack([view['min'], view['max']]).ravel()
+
+    return timestamps, values
+
+# Drop all rollups (e.g. after buffers.reset)
+def reset():
+    with tables_lock:
+        tables.clear()
@@ -0,0 +1,45 @@
+#Imports=========================================================================================================================#
+import threading
+import buffers
+
+
+
+#Scaling=========================================================================================================================#
+# The buffers hold raw counts. A channel's display values are an affine transform of them, value * scale + offset, with
+# scale = scaling_fact and offset an optional 'offset' in the channel config. Scaled values are kept per (device, channel)
+# and only the rows appended since the last call are transformed; the whole series is recomputed only when the transform
+# in the channel config changes.
+scaled = {}  # (device, channel) -> {'transform': (scale, offset), 'buffer': SeriesBuffer}
+scaled_lock = threading.Lock()
+
+# Get the (scale, offset) of a channel dictionary from utils.get_channels
+def get_transform(channel):
+    scale = float(channel['scaling_fact'] or 1)
+    if not scale: scale = 1
+    offset = float(channel.get('offset') or 0)
+
+    return scale, offset
+
+# Get the timestamps (int64 ms) and scaled values of one channel as of the last buffers.refresh
+def get_series(device, channel):
+    timestamps, values = buffers.get_series(device, channel['name'])
+    transform = get_transform(channel)
+    if transform == (1, 0):
+        return timestamps, values
+
+    with scaled_lock:
+        entry = scaled.get((device, channel['name']))
+        if entry is None or entry['transform'] != transform or entry['buffer'].size > len(values):
+            entry = {'transform': transform, 'buffer': buffers.SeriesBuffer(max(len(values), 1024))}
+            scaled[(device, channel['name'])] = entry
+        buffer = entry['buffer']
+        if buffer.size < len(values):
+            scale, offset = transform
+            buffer.append(timestamps[buffer.size:], values[buffer.size:] * scale + offset)
+
+        return buffer.view()
+
+# Drop the scaled values (e.g. after buffers.reset)
+def reset():
+    with scaled_lock:
+        scaled.clear()
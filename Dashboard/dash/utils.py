@@ -1,23 +1,90 @@
 #Imports=========================================================================================================================#
+from collections import OrderedDict
+import sys
+import threading
+import uuid
+import numpy as np
 import pandas as pd
-import pickle
+sys.path.append('../aws')
+import storage
+import config_store
+
+
+
+#Dictionaries====================================================================================================================#
+# Location, device and channel IDs are interned once per process: every frame codes them as a pandas Categorical with the
+# same (append-only) categories, so frames can be combined without recoding
+categories = {'location': [], 'deviceId': [], 'data': []}
+categories_dtypes = {column: pd.CategoricalDtype([]) for column in categories}
+categories_lock = threading.Lock()
+
+# Code a column with the shared dictionary, adding any IDs not seen before
+def to_categorical(column, values):
+    values = pd.Series(values)
+    uniques = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else values.unique()
+    with categories_lock:
+        known = categories_dtypes[column].categories
+        new = [value for value in uniques if value not in known]
+        if new:
+            categories[column] = categories[column] + sorted(new)
+            categories_dtypes[column] = pd.CategoricalDtype(categories[column])
+        dtype = categories_dtypes[column]
+
+    return values.astype(dtype)
 
 
 
 #Data============================================================================================================================#
-# Read the data csv file into a dataframe
-def get_df(filename):
-    df = pd.read_csv(filename, parse_dates=True)
-    df.index = pd.to_datetime(df['timestamp'])
+# Read the sensor data (optionally only some devices/columns and a time range) from the local store into a dataframe
+def get_df(devices=None, start=None, end=None, columns=None):
+    df = storage.get_store().read(devices, start, end, columns)
+    for column in categories:
+        if column in df.columns:
+            df[column] = to_categorical(column, df[column])
+    if 'timestamp' in df.columns:
+        df.index = pd.to_datetime(df['timestamp'])
 
     return df
 
+# Read the sensor data into a wide frame (see to_wide_df)
+def get_wide_df(devices=None, start=None, end=None):
+    df = get_df(devices, start, end, columns=['deviceId', 'timestamp', 'data', 'value'])
+
+    return to_wide_df(df)
+
+# Convert long-format rows (one per channel per message) into a typed wide frame with one row per message: deviceId
+# (categorical), timestamp (int64 ms) and one column per channel - uint16 when every message has the channel and all of its
+# values are whole numbers that fit (raw counts), else float32 (scaled channels and gaps)
+def to_wide_df(df):
+    rows, keys = pd.MultiIndex.from_arrays([df['deviceId'], df['timestamp']]).factorize()
+    channels, channel_names = pd.factorize(df['data'], sort=True)
+    values = np.full((len(keys), len(channel_names)), np.nan, dtype=np.float32)
+    values[rows, channels] = df['value'].to_numpy(dtype=np.float32)
+
+    df_wide = pd.DataFrame({
+        'deviceId': to_categorical('deviceId', keys.get_level_values(0)).array,
+        'timestamp': keys.get_level_values(1).to_numpy().astype('datetime64[ms]').astype(np.int64),
+    })
+    for i, channel in enumerate(channel_names):
+        column = values[:, i]
+        if (not np.isnan(column).any() and column.min() >= 0 and column.max() <= np.iinfo(np.uint16).max
+                and np.array_equal(column, np.floor(column))):
+            column = column.astype(np.uint16)
+        df_wide[channel] = column
+    df_wide = df_wide.sort_values(by='timestamp', kind='mergesort').reset_index(drop=True)
+
+    return df_wide
+
+# Convert the int64 ms timestamps of a wide frame into datetimes for plotting
+def get_datetimes(timestamps):
+    return pd.DatetimeIndex(np.asarray(timestamps).astype('datetime64[ms]'))
+
 
 
 #Lists of Dictionaries===========================================================================================================#
 # Get a location list of dictionaries from store_data
 def get_locations():
-    data = get_store_data()
+    data = store.get()
     locations_ld = []
     locations = data[0]
     for location in locations:
@@ -27,7 +94,7 @@ def get_locations():
 
 # Get a device list of dictionaries from store_data
 def get_devices(location=None):
-    data = get_store_data()
+    data = store.get()
     devices_ld = []
     if location:
         devices = data[0][location]['children']
@@ -42,7 +109,7 @@ def get_devices(location=None):
 
 # Get a channel list of dictionaries from store_data
 def get_channels(location=None, device=None):
-    data = get_store_data()
+    data = store.get()
     channels_ld = []
     if location and device:
         channels = data[0][location]['children'][device]['children']
@@ -80,38 +147,30 @@ def write_store_data():
         locations_d[location] = {'alias': location, 'children': devices_d}
     data.append(locations_d)
 
-    file = open(r'temp/dcc_store_data.pkl', 'wb')
-    pickle.dump(data, file)
-    file.close()
+    update_store_data(data)
 
-# Get the store data
+# Get a copy of the store data that the caller may modify and pass to update_store_data
 def get_store_data():
-    file = open(r'temp/dcc_store_data.pkl', 'rb')
-    flag = False
-    while not flag:
-        try:
-            data = pickle.load(file)
-            flag = True
-        except EOFError:
-            pass
-    file.close()
-
-    return data
+    return store.copy()
 
 # Update the store data
 def update_store_data(data):
-    file = open(r'temp/dcc_store_data.pkl', 'wb')
-    pickle.dump(data, file)
-    file.close()
+    store.update(data)
 
 # Add locations/devices to the store data
 def add_device_store_data():
-    df = get_df('../data/sensor_data.csv')
-    data = get_store_data()
+    df = storage.get_store().read_devices()
     devices_l = sorted(df['deviceId'].unique()),
 
+    # Nothing to add (the usual case): skip copying the store data
+    locations = store.get()[0]
+    known = {(location, device) for location in locations for device in locations[location]['children']}
+    if set(zip(df['location'], df['deviceId'])) <= known:
+        return
+    data = get_store_data()
+
     for device in devices_l[0]:
-        location = df.loc[df['deviceId'] == device]['location'][0]
+        location = df.loc[df['deviceId'] == device]['location'].iloc[0]
         if not data[0].get(location):
             data[0][location] = {'alias': location, 'children': {}}
         if not data[0][location]['children'].get(device):
@@ -128,29 +187,50 @@ def add_device_store_data():
             if data[0].get('Default_Location'): del data[0]['Default_Location']
             update_store_data(data)
 
+# The store data, cached by this process (or reset if nothing was persisted yet)
+store = config_store.get_config_store()
+if store.get() is None:
+    write_store_data()
+
 
 
 #Tree============================================================================================================================#
-# Write the nodes of the navigation tree from the store data
-def update_tree_nodes(data):
+# Build the node of one device
+def get_device_node(location, device, device_d):
+    dev_children = []
+    channels = device_d['children']
+    for channel in channels:
+        if channels[channel]['disabled'] == 'Enabled':
+            ch_node = {}
+            ch_node['value'] = 'loc' + location + '_' + 'dev' + device + '_' + channel
+            ch_node['label'] = channels[channel]['alias'] if channels[channel]['alias'] else channel
+            dev_children.append(ch_node)
+    dev_node = {}
+    dev_node['value'] = 'loc' + location + '_' + 'dev' + device
+    dev_node['label'] = device_d['alias'] if device_d['alias'] else device
+    dev_node['children'] = dev_children
+
+    return dev_node
+
+# Write the nodes of the navigation tree from the store data. With a device_nodes cache ((location, device) -> (device dict,
+# node)) only the devices whose dictionary changed are rebuilt; the store data is replaced, never modified, on update, so the
+# cached dictionaries can be compared with the new ones.
+def update_tree_nodes(data, device_nodes=None):
     tree_children = []
+    seen = set()
     locations = data[0]
     for location in locations:
         loc_children = []
         devices = locations[location]['children']
         for device in devices:
-            dev_children = []
-            channels = devices[device]['children']
-            for channel in channels:
-                if channels[channel]['disabled'] == 'Enabled':
-                    ch_node = {}
-                    ch_node['value'] = 'loc' + location + '_' + 'dev' + device + '_' + channel
-                    ch_node['label'] = channels[channel]['alias'] if channels[channel]['alias'] else channel
-                    dev_children.append(ch_node)
-            dev_node = {}
-            dev_node['value'] = 'loc' + location + '_' + 'dev' + device
-            dev_node['label'] = devices[device]['alias'] if devices[device]['alias'] else device
-            dev_node['children'] = dev_children
+            cached = device_nodes.get((location, device)) if device_nodes is not None else None
+            if cached and cached[0] == devices[device]:
+                dev_node = cached[1]
+            else:
+                dev_node = get_device_node(location, device, devices[device])
+                if device_nodes is not None:
+                    device_nodes[(location, device)] = (devices[device], dev_node)
+            seen.add((location, device))
             loc_children.append(dev_node)
         loc_node = {}
         loc_node['value'] = 'loc' + location
@@ -158,16 +238,54 @@ def update_tree_nodes(data):
         loc_node['children'] = loc_children
         tree_children.append(loc_node)
 
+    if device_nodes is not None:
+        for key in [key for key in device_nodes if key not in seen]:
+            del device_nodes[key]
+
     return tree_children
 
+# The navigation tree of the current store data, rebuilt (only the changed devices) when the config store version changes
+tree = {'version': None, 'nodes': None, 'device_nodes': {}}
+tree_lock = threading.Lock()
+
+# Get the version and nodes of the navigation tree
+def get_tree_nodes():
+    with tree_lock:
+        version = store.get_version()
+        if version != tree['version']:
+            tree['nodes'] = update_tree_nodes(store.get(), tree['device_nodes'])
+            tree['version'] = version
+
+        return tree['version'], tree['nodes']
+
 
 
 #Views===========================================================================================================================#
-# Get the current page type and instance
-def get_current_page_dict():
-    with open('temp/tree.txt', 'r') as file:
-        checked_global = [current_place.rstrip() for current_place in file.readlines()]
-        file.close()
+# The view state (the checked nav_tree nodes) lives per browser session in the 'view_state' dcc.Store and is passed to the
+# callbacks as State/Input. Parsed page dictionaries are cached server-side per session, so callbacks do no parsing or I/O.
+sessions = OrderedDict()  # session -> (checked, page dict)
+max_sessions = 1024
+sessions_lock = threading.Lock()
+
+# Get the checked nav_tree nodes of a view state
+def get_checked(view_state):
+    return view_state['checked'] if view_state else []
+
+# Get the view state of a session after a new selection (a new session ID is issued on the first selection)
+def set_view_state(view_state, checked):
+    session = view_state['session'] if view_state else uuid.uuid4().hex
+
+    return {'session': session, 'checked': list(checked)}
+
+# Get the current page type and instance of a view state
+def get_page_dict(view_state):
+    checked_global = get_checked(view_state)
+    session = view_state['session'] if view_state else None
+    with sessions_lock:
+        cached = sessions.get(session)
+        if cached and cached[0] == checked_global:
+            sessions.move_to_end(session)
+            return cached[1]
 
     page_dict = {}
     string = checked_global[0].replace('_', '')
@@ -177,4 +295,8 @@ def get_current_page_dict():
         string, page_dict['dev'] = (string.split('dev'))
     if (string.find('loc') > -1):
         string, page_dict['loc'] = (string.split('loc'))
+    with sessions_lock:
+        sessions[session] = (list(checked_global), page_dict)
+        if len(sessions) > max_sessions:
+            sessions.popitem(last=False)
     return page_dict